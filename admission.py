@@ -0,0 +1,125 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from telegram import Update
+from telegram.ext import CallbackContext, DispatcherHandlerStop
+from ratelimit import TokenBucket
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Ограниченный по размеру словарь: при переполнении вытесняются самые старые ключи
+class _BoundedDict(OrderedDict):
+    def __init__(self, max_size):
+        super().__init__()
+        self.max_size = max_size
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+
+
+# Допуск обновлений к обработчикам. Регистрируется в группе -1 и останавливает
+# обработку отброшенного обновления через DispatcherHandlerStop.
+#  - повторно полученные обновления и повторные нажатия одной кнопки отбрасываются;
+#  - при очереди больше max_backlog новые обновления сбрасываются;
+#  - у каждого пользователя своё ограничение частоты, сверх него сообщения отбрасываются;
+#  - общее ограничение придерживает обновления до max_delay секунд, дальше сбрасывает.
+# Администраторы проходят без ограничений.
+class AdmissionControl:
+    def __init__(self, backlog, exempt_ids=(), user_rate=1.0, user_burst=5, global_rate=100.0,
+                 max_delay=2.0, max_backlog=1000, callback_window=2.0, max_tracked=10000):
+        self.backlog = backlog
+        self.exempt_ids = set(exempt_ids)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate)
+        self.max_delay = max_delay
+        self.max_backlog = max_backlog
+        self.callback_window = callback_window
+        self._lock = threading.Lock()
+        self._seen_updates = _BoundedDict(max_tracked)
+        self._seen_callbacks = _BoundedDict(max_tracked)
+        self._user_buckets = _BoundedDict(max_tracked)
+        # Пользователи, которым уже отправлено предупреждение о слишком частых сообщениях
+        self._warned = _BoundedDict(max_tracked)
+
+    def _drop(self, reason):
+        metrics.ADMISSION_DROPPED.inc(reason=reason)
+        raise DispatcherHandlerStop()
+
+    # Без ответа на нажатие кнопка у студента крутится, пока Telegram не сбросит её по таймауту
+    def _answer(self, query):
+        try:
+            query.answer()
+        except Exception:
+            logger.warning("Не удалось ответить на нажатие кнопки %s", query.data)
+
+    def _is_repeated_press(self, query, user_id):
+        if query.message is None:
+            return False
+        key = (user_id, query.message.chat_id, query.message.message_id, query.data)
+        now = time.monotonic()
+        with self._lock:
+            pressed_at = self._seen_callbacks.get(key)
+            self._seen_callbacks[key] = now
+        return pressed_at is not None and now - pressed_at < self.callback_window
+
+    def _user_bucket(self, user_id):
+        with self._lock:
+            bucket = self._user_buckets.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._user_buckets[user_id] = bucket
+        return bucket
+
+    def admit(self, update: Update, context: CallbackContext):
+        with self._lock:
+            duplicate = update.update_id in self._seen_updates
+            self._seen_updates[update.update_id] = True
+        if duplicate:
+            self._drop('duplicate')
+
+        user = update.effective_user
+        if user is None or user.id in self.exempt_ids:
+            return
+
+        if self.backlog() > self.max_backlog:
+            self._drop('overload')
+
+        if update.callback_query and self._is_repeated_press(update.callback_query, user.id):
+            self._answer(update.callback_query)
+            self._drop('repeated_press')
+
+        if self._user_bucket(user.id).try_acquire():
+            if update.callback_query:
+                self._answer(update.callback_query)
+            self._warn_flood(update, context, user.id)
+            self._drop('user_rate')
+        with self._lock:
+            self._warned.pop(user.id, None)
+
+        if self.global_bucket.try_acquire():
+            metrics.ADMISSION_DELAYED.inc()
+            if not self.global_bucket.acquire(timeout=self.max_delay):
+                self._drop('global_rate')
+
+    # Одно предупреждение на серию отброшенных сообщений, чтобы не отвечать на каждое
+    def _warn_flood(self, update, context, user_id):
+        if update.effective_chat is None or update.callback_query:
+            return
+        with self._lock:
+            if user_id in self._warned:
+                return
+            self._warned[user_id] = True
+        try:
+            context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text="Вы отправляете сообщения слишком часто. Подождите несколько секунд и повторите."
+            )
+        except Exception:
+            logger.warning("Не удалось предупредить пользователя %s о слишком частых сообщениях", user_id)
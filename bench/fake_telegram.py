@@ -0,0 +1,263 @@
+import json
+import time
+import threading
+import logging
+import http.client
+from urllib.parse import urlsplit
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Эколина', 'username': 'ecobot_fake_bot'}
+
+
+# Разбор multipart/form-data, которым PTB отправляет загружаемые файлы
+def parse_multipart(content_type, body):
+    message = BytesParser(policy=HTTP).parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    fields = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if part.get_filename():
+            fields[name] = {'filename': part.get_filename(), 'size': len(part.get_payload(decode=True))}
+        else:
+            fields[name] = part.get_payload(decode=True).decode('utf-8')
+    return fields
+
+
+# Заглушка Telegram Bot API: очередь входящих обновлений и журнал исходящих вызовов
+class FakeTelegram:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0):
+        # Задержка ответа на исходящие вызовы, имитирует сетевую задержку до api.telegram.org
+        self.latency = latency
+        self._updates = []
+        self._next_update_id = 1
+        self._next_message_id = 1
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._chat_conds = {}
+        self.calls = []
+        self.calls_by_chat = {}
+        self.uploaded_bytes = 0
+        # Если задан webhook (setWebhook), обновления доставляются POST-запросами по порядку
+        self.webhook_url = None
+        self.webhook_secret = None
+        self._stopped = False
+        self._delivery_thread = threading.Thread(target=self._deliver_loop, name='fake-telegram-webhook', daemon=True)
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-telegram', daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    def start(self):
+        self._thread.start()
+        self._delivery_thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._delivery_thread.join()
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Входящие обновления
+
+    def push_update(self, update):
+        with self._cond:
+            update['update_id'] = self._next_update_id
+            self._next_update_id += 1
+            self._updates.append(update)
+            self._cond.notify_all()
+        return update['update_id']
+
+    def _make_user(self, user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f'Студент {user_id}'}
+
+    def _make_message(self, chat_id, sender, **fields):
+        with self._lock:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        message = {'message_id': message_id, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'}, 'from': sender}
+        message.update(fields)
+        return message
+
+    def send_text(self, user_id, text):
+        fields = {'text': text}
+        if text.startswith('/'):
+            fields['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self.push_update({'message': self._make_message(user_id, self._make_user(user_id), **fields)})
+
+    def press_button(self, user_id, message, data):
+        return self.push_update({'callback_query': {
+            'id': f'{user_id}-{time.monotonic_ns()}',
+            'from': self._make_user(user_id),
+            'chat_instance': str(user_id),
+            'message': message,
+            'data': data,
+        }})
+
+    # Исходящие вызовы бота
+
+    def _chat_cond(self, chat_id):
+        cond = self._chat_conds.get(chat_id)
+        if cond is None:
+            cond = self._chat_conds[chat_id] = threading.Condition(self._lock)
+        return cond
+
+    def call_count(self, chat_id):
+        with self._lock:
+            return len(self.calls_by_chat.get(chat_id, ()))
+
+    def wait_for(self, chat_id, predicate, since=0, timeout=30):
+        """Ждёт вызова бота в чате chat_id, начиная с индекса since, для которого predicate вернёт True."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            calls = self.calls_by_chat.setdefault(chat_id, [])
+            cond = self._chat_cond(chat_id)
+            index = since
+            while True:
+                while index < len(calls):
+                    call = calls[index]
+                    index += 1
+                    if predicate(call):
+                        return call
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError('Бот не ответил вовремя')
+                cond.wait(remaining)
+
+    def _record(self, method, params, result):
+        chat_id = int(params['chat_id']) if params.get('chat_id') else None
+        with self._lock:
+            call = {'method': method, 'params': params, 'result': result, 'time': time.perf_counter()}
+            self.calls.append(call)
+            if chat_id is not None:
+                self.calls_by_chat.setdefault(chat_id, []).append(call)
+                self._chat_cond(chat_id).notify_all()
+        return call
+
+    # Доставка обновлений на webhook: одно соединение, следующее обновление только после ответа 200
+    def _deliver_loop(self):
+        connection = None
+        while True:
+            with self._cond:
+                while not self._stopped and not (self.webhook_url and self._updates):
+                    self._cond.wait(0.5)
+                if self._stopped:
+                    return
+                url, secret, update = urlsplit(self.webhook_url), self.webhook_secret, self._updates[0]
+            headers = {'Content-Type': 'application/json'}
+            if secret:
+                headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+            try:
+                if connection is None:
+                    connection = http.client.HTTPConnection(url.hostname, url.port, timeout=10)
+                connection.request('POST', url.path or '/', json.dumps(update, ensure_ascii=False).encode('utf-8'), headers)
+                response = connection.getresponse()
+                response.read()
+                delivered = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection = None
+                delivered = False
+            if not delivered:
+                time.sleep(0.1)
+                continue
+            with self._cond:
+                if self._updates and self._updates[0] is update:
+                    self._updates.pop(0)
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        timeout = float(params.get('timeout') or 0)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return list(self._updates[:100])
+
+    def handle(self, method, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method in ('deleteWebhook', 'setWebhook'):
+            with self._cond:
+                self.webhook_url = params.get('url') or None
+                self.webhook_secret = params.get('secret_token')
+                self._cond.notify_all()
+            return True
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        if self.latency:
+            time.sleep(self.latency)
+        result = self._call(method, params)
+        self._record(method, params, result)
+        return result
+
+    def _call(self, method, params):
+        if method == 'sendMessage':
+            fields = {'text': params.get('text', '')}
+            markup = params.get('reply_markup')
+            if isinstance(markup, str):
+                markup = json.loads(markup)
+            # В сообщении Telegram возвращает только inline-клавиатуру
+            if markup and 'inline_keyboard' in markup:
+                fields['reply_markup'] = markup
+            return self._make_message(int(params['chat_id']), BOT_USER, **fields)
+        if method == 'sendPhoto':
+            photo = params.get('photo')
+            if isinstance(photo, dict):
+                self.uploaded_bytes += photo['size']
+                file_id = f"uploaded-{photo['filename']}"
+            else:
+                file_id = photo
+            fields = {'photo': [{'file_id': file_id, 'file_unique_id': file_id, 'width': 1, 'height': 1}]}
+            if params.get('caption'):
+                fields['caption'] = params['caption']
+            return self._make_message(int(params['chat_id']), BOT_USER, **fields)
+        if method == 'sendDocument':
+            document = params.get('document')
+            if isinstance(document, dict):
+                self.uploaded_bytes += document['size']
+            return self._make_message(int(params['chat_id']), BOT_USER, document={'file_id': 'document', 'file_unique_id': 'document'})
+        if method == 'editMessageText':
+            return self._make_message(int(params['chat_id']), BOT_USER, text=params.get('text', ''))
+        if method in ('sendChatAction', 'answerCallbackQuery'):
+            return True
+        raise ValueError(f'Метод {method} не поддерживается заглушкой')
+
+    def _make_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                method = self.path.rsplit('/', 1)[-1]
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                content_type = self.headers.get('Content-Type', '')
+                if content_type.startswith('multipart/form-data'):
+                    params = parse_multipart(content_type, body)
+                else:
+                    params = json.loads(body) if body else {}
+                try:
+                    payload = {'ok': True, 'result': fake.handle(method, params)}
+                except ValueError as e:
+                    payload = {'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'}
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,179 @@
+"""Нагрузочный тест бота против локальной заглушки Telegram Bot API.
+
+Виртуальные студенты параллельно проходят регистрацию и лабораторную работу №1:
+/start -> ФИО -> факультет -> группа -> лабораторные -> lab1 -> объект -> 3 пункта -> confirm_yes.
+
+Запуск из корня репозитория:
+    python bench/loadtest.py --users 500
+    python bench/loadtest.py --users 2000 --dispatch asyncio --api-latency 0.05
+    python bench/loadtest.py --users 1000 --webhook-workers 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import resource
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_telegram import FakeTelegram
+
+ADMIN_ID = 1000
+
+
+def sent(method, contains=''):
+    def predicate(call):
+        params = call['params']
+        text = params.get('text') or params.get('caption') or ''
+        return call['method'] == method and contains in text
+    return predicate
+
+
+# Шаги сценария: (имя, действие, ожидаемый ответ бота)
+SCENARIO = [
+    ('start', lambda fake, uid, ctx: fake.send_text(uid, '/start'), sent('sendPhoto', 'Привет')),
+    ('ask_name', lambda fake, uid, ctx: fake.send_text(uid, 'Иванов Иван Иванович'), sent('sendMessage', 'факультет')),
+    ('ask_faculty', lambda fake, uid, ctx: fake.send_text(uid, 'Факультет экотехнологий'), sent('sendMessage', 'группы')),
+    ('ask_group', lambda fake, uid, ctx: fake.send_text(uid, f'G{4100 + uid % 50}'), sent('sendMessage', 'Выберите действие')),
+    ('handle_lab_work', lambda fake, uid, ctx: fake.send_text(uid, '🔬 Помочь с лабораторными'), sent('sendMessage', 'Выберите номер')),
+    ('lab_work_selection', lambda fake, uid, ctx: fake.press_button(uid, ctx['last']['result'], 'lab1'), sent('sendMessage', 'объект')),
+    ('lab1_object', lambda fake, uid, ctx: fake.send_text(uid, 'Общежитие'), sent('sendMessage', 'первому вопросу')),
+    ('lab1_benefit1', lambda fake, uid, ctx: fake.send_text(uid, 'Экономия'), sent('sendMessage', 'второй пункт')),
+    ('lab1_benefit2', lambda fake, uid, ctx: fake.send_text(uid, 'Чистота'), sent('sendMessage', 'третий пункт')),
+    ('lab1_benefit3', lambda fake, uid, ctx: fake.send_text(uid, 'Экология'), sent('sendMessage', 'Преимущества')),
+    ('lab1_confirm', lambda fake, uid, ctx: fake.press_button(uid, ctx['last']['result'], 'confirm_yes'), sent('editMessageText', 'завершена')),
+]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run_user(fake, uid, latencies, timeout):
+    ctx = {}
+    for name, action, expect in SCENARIO:
+        since = fake.call_count(uid)
+        started = time.perf_counter()
+        action(fake, uid, ctx)
+        call = fake.wait_for(uid, expect, since=since, timeout=timeout)
+        latencies[name].append(call['time'] - started)
+        ctx['last'] = call
+
+
+def storage_size(work_dir):
+    return sum(
+        os.path.getsize(os.path.join(work_dir, name))
+        for name in os.listdir(work_dir)
+        if name.startswith('user_data')
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500, help='число виртуальных студентов')
+    parser.add_argument('--timeout', type=float, default=60, help='таймаут ожидания ответа бота, с')
+    parser.add_argument('--json', help='сохранить результаты в JSON-файл')
+    parser.add_argument('--dispatch', choices=('threads', 'asyncio'), default='threads', help='режим диспетчера бота')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа заглушки Bot API, с')
+    parser.add_argument('--webhook-workers', type=int, default=0,
+                        help='принимать обновления через webhook и обрабатывать их в N процессах')
+    args = parser.parse_args()
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    logging.basicConfig(level=logging.WARNING)
+    fake = FakeTelegram(latency=args.api_latency)
+    fake.start()
+
+    work_dir = tempfile.mkdtemp(prefix='ecobot-bench-')
+    os.chdir(work_dir)
+    with open('ekolina.jpg', 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    os.environ.update({
+        'TELEGRAM_TOKEN': '123456:BENCH',
+        'ADMIN_IDS': str(ADMIN_ID),
+        'TELEGRAM_API_URL': fake.base_url,
+        'MESSAGE_SCRIPT_DELAY_SCALE': '0',
+        'DISPATCH_MODE': args.dispatch,
+        # Виртуальные студенты отвечают без пауз, ограничение частоты для людей здесь не нужно
+        'USER_UPDATE_RATE': '1000',
+        'GLOBAL_UPDATE_RATE': '100000',
+    })
+
+    bot = router = None
+    if args.webhook_workers:
+        from telegram import Bot
+        from webhook import WebhookRouter
+        router = WebhookRouter(args.webhook_workers, port=0, path='/telegram')
+        router.start()
+        host, port = router.address
+        Bot(os.environ['TELEGRAM_TOKEN'], base_url=fake.base_url).set_webhook(f'http://{host}:{port}/telegram')
+    else:
+        import main as bot
+        logging.getLogger().setLevel(logging.WARNING)
+        updater = bot.build_updater()
+        updater.start_polling(poll_interval=0, timeout=1)
+
+    latencies = {name: [] for name, _, _ in SCENARIO}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as executor:
+        futures = [executor.submit(run_user, fake, 10000 + i, latencies, args.timeout) for i in range(args.users)]
+        errors = sum(1 for future in futures if future.exception())
+    elapsed = time.perf_counter() - started
+
+    if router:
+        router.stop()
+    else:
+        updater.stop()
+        updater.persistence.flush()
+        bot.user_data_manager.storage.close()
+    fake.stop()
+    # Счётчики хранилища процессов-обработчиков в этот процесс не попадают
+    storage = bot.user_data_manager.storage if bot else None
+
+    total_updates = sum(len(values) for values in latencies.values())
+    report = {
+        'users': args.users,
+        'dispatch': args.dispatch,
+        'webhook_workers': args.webhook_workers,
+        'api_latency_s': args.api_latency,
+        'failed_users': errors,
+        'elapsed_s': round(elapsed, 3),
+        'updates_per_s': round(total_updates / elapsed, 1),
+        'bot_api_calls': len(fake.calls),
+        'uploaded_bytes': fake.uploaded_bytes,
+        'storage_file_bytes': storage_size(work_dir),
+        'storage_writes': storage.writes if storage else None,
+        'storage_write_bytes': storage.bytes_written if storage else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'latency_ms': {
+            name: {q: round(percentile(values, int(q[1:])) * 1000, 1) for q in ('p50', 'p95', 'p99')}
+            for name, values in latencies.items()
+        },
+    }
+
+    print(f"Диспетчер: {args.dispatch}, процессов webhook: {args.webhook_workers}, задержка Bot API: {args.api_latency} с")
+    print(f"Пользователей: {args.users} (с ошибкой: {errors}), время: {report['elapsed_s']} с, "
+          f"обновлений/с: {report['updates_per_s']}")
+    print(f"Вызовов Bot API: {report['bot_api_calls']}, загружено фото: {report['uploaded_bytes']} байт")
+    print(f"Хранилище: {report['storage_writes']} записей, {report['storage_write_bytes']} байт данных, "
+          f"{report['storage_file_bytes']} байт на диске")
+    print(f"Пиковая память: {report['peak_rss_kb']} КБ")
+    print(f"{'обработчик':<22}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for name, values in report['latency_ms'].items():
+        print(f"{name:<22}{values['p50']:>10}{values['p95']:>10}{values['p99']:>10}")
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import time
+import sqlite3
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from telegram import ParseMode
+from telegram.error import RetryAfter, Unauthorized, BadRequest, NetworkError, TelegramError
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Статусы получателей рассылки
+PENDING, SENT, FAILED, BLOCKED = 'pending', 'sent', 'failed', 'blocked'
+
+
+# Очередь рассылок в SQLite: задания и статус каждого получателя переживают перезапуск
+class BroadcastStore:
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'job_id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'admin_chat_id INTEGER NOT NULL, '
+            'text TEXT, '
+            'photo_file_id TEXT, '
+            'progress_message_id INTEGER, '
+            'done INTEGER NOT NULL DEFAULT 0, '
+            'created_at REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS recipients ('
+            'job_id INTEGER NOT NULL, '
+            'user_id INTEGER NOT NULL, '
+            'status TEXT NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, '
+            'PRIMARY KEY (job_id, user_id));'
+            'CREATE TABLE IF NOT EXISTS blocked_users ('
+            'user_id INTEGER PRIMARY KEY, '
+            'blocked_at REAL NOT NULL);'
+        )
+
+    def create_job(self, admin_chat_id, text, photo_file_id, user_ids):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                job_id = self._conn.execute(
+                    'INSERT INTO jobs (admin_chat_id, text, photo_file_id, created_at) VALUES (?, ?, ?, ?)',
+                    (admin_chat_id, text, photo_file_id, time.time())
+                ).lastrowid
+                self._conn.executemany(
+                    'INSERT OR IGNORE INTO recipients (job_id, user_id, status) '
+                    'SELECT ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM blocked_users WHERE user_id = ?)',
+                    ((job_id, user_id, PENDING, user_id) for user_id in user_ids)
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                # Иначе соединение останется в открытой транзакции и следующие записи не сохранятся
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                raise
+        return job_id
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT admin_chat_id, text, photo_file_id, progress_message_id FROM jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+
+    def unfinished_jobs(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute('SELECT job_id FROM jobs WHERE done = 0 ORDER BY job_id')]
+
+    def set_progress_message(self, job_id, message_id):
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET progress_message_id = ? WHERE job_id = ?', (message_id, job_id))
+
+    def finish_job(self, job_id):
+        with self._lock:
+            self._conn.execute('UPDATE jobs SET done = 1 WHERE job_id = ?', (job_id,))
+
+    def pending_recipients(self, job_id):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT user_id FROM recipients WHERE job_id = ? AND status = ?', (job_id, PENDING)
+            )]
+
+    def set_status(self, job_id, user_id, status, attempts):
+        with self._lock:
+            self._conn.execute(
+                'UPDATE recipients SET status = ?, attempts = ? WHERE job_id = ? AND user_id = ?',
+                (status, attempts, job_id, user_id)
+            )
+            if status == BLOCKED:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO blocked_users (user_id, blocked_at) VALUES (?, ?)', (user_id, time.time())
+                )
+
+    def counts(self, job_id):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT status, COUNT(*) FROM recipients WHERE job_id = ? GROUP BY status', (job_id,)
+            ).fetchall()
+        counts = dict.fromkeys((PENDING, SENT, FAILED, BLOCKED), 0)
+        counts.update(rows)
+        return counts
+
+    # Пользователь снова написал боту, значит он его разблокировал
+    def unblock(self, user_id):
+        with self._lock:
+            self._conn.execute('DELETE FROM blocked_users WHERE user_id = ?', (user_id,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Рассылка сообщений с ограничением скорости, повторами и продолжением после перезапуска
+class BroadcastManager:
+    def __init__(self, store, rate=25, workers=8, max_attempts=5, retry_delay=1.0, progress_interval=5.0):
+        self.store = store
+        self.bucket = TokenBucket(rate)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.progress_interval = progress_interval
+        self.bot = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    # Запуск менеджера и продолжение незавершённых рассылок.
+    # Если процессов с ботом несколько, продолжает рассылки только один из них (resume=True).
+    def start(self, bot, resume=True):
+        self.bot = bot
+        if not resume:
+            return
+        for job_id in self.store.unfinished_jobs():
+            logger.info("Продолжение рассылки %d после перезапуска", job_id)
+            self._spawn(job_id)
+
+    def stop(self):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self.store.close()
+
+    def submit(self, admin_chat_id, text, photo_file_id, user_ids):
+        job_id = self.store.create_job(admin_chat_id, text, photo_file_id, user_ids)
+        total = sum(self.store.counts(job_id).values())
+        message = self.bot.send_message(chat_id=admin_chat_id, text=f"Рассылка запущена: 0 из {total}.", parse_mode=ParseMode.HTML)
+        self.store.set_progress_message(job_id, message.message_id)
+        self._spawn(job_id)
+        return job_id
+
+    def _spawn(self, job_id):
+        thread = threading.Thread(target=self._run_job, args=(job_id,), name=f'broadcast-{job_id}', daemon=True)
+        self._threads = [t for t in self._threads if t.is_alive()]
+        self._threads.append(thread)
+        thread.start()
+
+    def _run_job(self, job_id):
+        admin_chat_id, text, photo_file_id, progress_message_id = self.store.get_job(job_id)
+        in_flight = threading.BoundedSemaphore(self.workers)
+        last_report = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f'broadcast-{job_id}') as executor:
+            for user_id in self.store.pending_recipients(job_id):
+                if self._stop_event.is_set():
+                    break
+                in_flight.acquire()
+                self.bucket.acquire()
+                future = executor.submit(self._deliver, job_id, user_id, text, photo_file_id)
+                future.add_done_callback(lambda _: in_flight.release())
+
+                if time.monotonic() - last_report >= self.progress_interval:
+                    self._report(job_id, admin_chat_id, progress_message_id)
+                    last_report = time.monotonic()
+
+        if self._stop_event.is_set() and self.store.counts(job_id)[PENDING]:
+            return
+        self.store.finish_job(job_id)
+        self._report(job_id, admin_chat_id, progress_message_id, finished=True)
+
+    def _deliver(self, job_id, user_id, text, photo_file_id):
+        attempts = 0
+        while attempts < self.max_attempts and not self._stop_event.is_set():
+            attempts += 1
+            try:
+                if photo_file_id:
+                    self.bot.send_photo(chat_id=user_id, photo=photo_file_id, caption=text, parse_mode=ParseMode.HTML)
+                else:
+                    self.bot.send_message(chat_id=user_id, text=text, parse_mode=ParseMode.HTML)
+                self.store.set_status(job_id, user_id, SENT, attempts)
+                return
+            except RetryAfter as e:
+                # Ограничение Telegram действует на всего бота, поэтому останавливаем все отправки.
+                # Получатель тут ни при чём, попытка доставки не засчитывается.
+                logger.warning("Flood control при рассылке %d, пауза %s с", job_id, e.retry_after)
+                attempts -= 1
+                self.bucket.pause(e.retry_after)
+                self.bucket.acquire()
+            except Unauthorized:
+                self.store.set_status(job_id, user_id, BLOCKED, attempts)
+                return
+            except BadRequest as e:
+                logger.warning("Не удалось отправить сообщение пользователю %d: %s", user_id, e)
+                self.store.set_status(job_id, user_id, FAILED, attempts)
+                return
+            except NetworkError:
+                self._stop_event.wait(self.retry_delay * 2 ** (attempts - 1))
+                self.bucket.acquire()
+            except TelegramError as e:
+                logger.warning("Ошибка при отправке пользователю %d: %s", user_id, e)
+                self.store.set_status(job_id, user_id, FAILED, attempts)
+                return
+
+        if not self._stop_event.is_set():
+            self.store.set_status(job_id, user_id, FAILED, attempts)
+
+    # Обновление сообщения администратора с прогрессом рассылки
+    def _report(self, job_id, admin_chat_id, progress_message_id, finished=False):
+        counts = self.store.counts(job_id)
+        total = sum(counts.values())
+        done = total - counts[PENDING]
+        if finished:
+            text = f"Сообщение отправлено {counts[SENT]} пользователям."
+            if counts[BLOCKED] or counts[FAILED]:
+                text += f"\nЗаблокировали бота: {counts[BLOCKED]}, ошибки доставки: {counts[FAILED]}."
+        else:
+            text = f"Рассылка: обработано {done} из {total}, отправлено {counts[SENT]}."
+        try:
+            if progress_message_id:
+                self.bot.edit_message_text(chat_id=admin_chat_id, message_id=progress_message_id, text=text, parse_mode=ParseMode.HTML)
+            else:
+                self.bot.send_message(chat_id=admin_chat_id, text=text, parse_mode=ParseMode.HTML)
+        except TelegramError as e:
+            logger.warning("Не удалось обновить прогресс рассылки %d: %s", job_id, e)
@@ -0,0 +1,13 @@
+import os
+from dotenv import load_dotenv
+
+# Общие базы данных и выбор хранилища. Их открывают бот, webhook-маршрутизатор
+# и выгрузка, поэтому настройки читаются в одном месте, а не в каждом модуле.
+load_dotenv()
+
+USER_DATA_FILE = 'user_data.json'
+USER_DATA_DB = os.getenv('USER_DATA_DB', 'user_data.db')
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'sqlite')
+BROADCAST_DB = os.getenv('BROADCAST_DB', 'broadcast.db')
+# Состояния диалогов и context.user_data, переживающие перезапуск
+PERSISTENCE_DB = os.getenv('PERSISTENCE_DB', 'bot_state.db')
@@ -0,0 +1,26 @@
+import sys
+
+
+def group_key(group):
+    return sys.intern(group.strip().upper())
+
+
+def faculty_key(faculty):
+    return sys.intern(faculty.strip().casefold())
+
+
+# Выбор получателей адресных рассылок по группе и факультету.
+# Пользователи ищутся по индексам хранилища, поэтому в памяти списки групп не хранятся.
+class UserDirectory:
+    def __init__(self, storage, excluded_ids=()):
+        self.storage = storage
+        self.excluded_ids = set(excluded_ids)
+
+    def _select(self, user_ids):
+        return [user_id for user_id in user_ids if user_id not in self.excluded_ids]
+
+    def recipients(self, target=None):
+        """Получатели рассылки: все пользователи, группа или факультет. Администраторы исключены."""
+        if not target:
+            return self._select(self.storage.find_users())
+        return self._select(self.storage.find_users(group=target)) or self._select(self.storage.find_users(faculty=target))
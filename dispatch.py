@@ -0,0 +1,108 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+from uuid import uuid4
+from telegram import Update
+from telegram.ext import Dispatcher
+
+logger = logging.getLogger(__name__)
+
+
+# Диспетчер на asyncio: обновления разных чатов обрабатываются параллельно,
+# а обновления одного чата строго по очереди, чтобы состояния ConversationHandler не путались.
+# Обработчики остаются синхронными и выполняются в пуле из concurrency потоков.
+class AsyncioDispatcher(Dispatcher):
+    def __init__(self, *args, concurrency=64, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency
+        self._stop_requested = threading.Event()
+        self._executor = None
+        # Очереди необработанных обновлений по чатам; чат есть в словаре, пока его очередь разбирается
+        self._chats = {}
+        self._tasks = set()
+
+    def start(self, ready=None):
+        if self.running:
+            logger.warning('Диспетчер уже запущен')
+            if ready is not None:
+                ready.set()
+            return
+        # Потоки для обработчиков с run_async=True
+        self._init_async_threads(str(uuid4()), self.workers)
+        self.running = True
+        try:
+            asyncio.run(self._run(ready))
+        finally:
+            self.running = False
+
+    def stop(self):
+        if self.running:
+            self._stop_requested.set()
+            while self.running:
+                time.sleep(0.1)
+            self._stop_requested.clear()
+        super().stop()
+
+    async def _run(self, ready):
+        loop = asyncio.get_running_loop()
+        self._executor = ThreadPoolExecutor(self.concurrency, thread_name_prefix='dispatch')
+        if ready is not None:
+            ready.set()
+        try:
+            # Перед остановкой разбираются обновления, уже попавшие в очередь
+            while not self._stop_requested.is_set() or not self.update_queue.empty():
+                # Ожидание очереди обновлений не блокирует цикл событий
+                for update in await loop.run_in_executor(None, self._next_updates):
+                    self._route(update)
+            if self._tasks:
+                await asyncio.wait(list(self._tasks))
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _next_updates(self):
+        try:
+            updates = [self.update_queue.get(True, 1)]
+        except Empty:
+            return []
+        while True:
+            try:
+                updates.append(self.update_queue.get_nowait())
+            except Empty:
+                return updates
+
+    def _route(self, update):
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            self._spawn(self._process(update))
+            return
+        pending = self._chats.get(chat.id)
+        if pending is not None:
+            pending.append(update)
+            return
+        self._chats[chat.id] = deque([update])
+        self._spawn(self._drain(chat.id))
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _drain(self, chat_id):
+        pending = self._chats[chat_id]
+        try:
+            while pending:
+                await self._process(pending.popleft())
+        finally:
+            del self._chats[chat_id]
+
+    async def _process(self, update):
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.process_update, update)
+        except Exception:
+            logger.exception("Ошибка при обработке обновления %s", update)
+        finally:
+            self.update_queue.task_done()
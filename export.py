@@ -0,0 +1,129 @@
+"""Выгрузка ответов по лабораторной работе №1 в CSV или XLSX.
+
+Записи читаются из хранилища порциями и сразу пишутся в файл, весь набор данных в памяти не собирается.
+
+Запуск из командной строки:
+    python export.py --group G4150 --format xlsx --output lab1.xlsx
+    python export.py --new --state-file export_state.json --output lab1_new.csv
+"""
+import os
+import io
+import csv
+import json
+import argparse
+from datetime import datetime
+import config
+from directory import group_key
+from storage import JsonFileStorage, SQLiteStorage
+
+EXPORT_FIELDS = ['user_id', 'name', 'faculty', 'group', 'lab1_object', 'lab1_benefit1', 'lab1_benefit2', 'lab1_benefit3', 'updated_at']
+LAB1_FIELDS = ('lab1_object', 'lab1_benefit1', 'lab1_benefit2', 'lab1_benefit3')
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def iter_submissions(storage, group=None, since=None):
+    """Отдаёт строки выгрузки для пользователей, ответивших хотя бы на один вопрос лабораторной №1."""
+    for user_id, data, updated_at in storage.iter_records(since=since, group=group):
+        if any(data.get(field) for field in LAB1_FIELDS):
+            yield dict(data, user_id=user_id, updated_at=updated_at)
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='seconds') if timestamp else ''
+
+
+# Текст от студентов, начинающийся с =, +, - или @, Excel считает формулой; апостроф делает его просто текстом
+def _safe_cell(value):
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+# Счётчик выгруженных строк и наибольшее updated_at среди них (отметка для следующей выгрузки)
+class ExportResult:
+    def __init__(self):
+        self.count = 0
+        self.watermark = None
+
+    def track(self, rows):
+        for row in rows:
+            self.count += 1
+            if row['updated_at'] and (self.watermark is None or row['updated_at'] > self.watermark):
+                self.watermark = row['updated_at']
+            yield [_format_time(row[field]) if field == 'updated_at' else _safe_cell(row.get(field, '')) for field in EXPORT_FIELDS]
+
+
+def write_export(rows, fileobj, file_format='csv'):
+    result = ExportResult()
+    if file_format == 'csv':
+        _write_csv(result.track(rows), fileobj)
+    elif file_format == 'xlsx':
+        _write_xlsx(result.track(rows), fileobj)
+    else:
+        raise ValueError(f"Неизвестный формат выгрузки: {file_format}")
+    return result
+
+
+def _write_csv(lines, fileobj):
+    # utf-8-sig, чтобы Excel правильно открыл кириллицу
+    text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='', write_through=True)
+    writer = csv.writer(text, delimiter=';')
+    writer.writerow(EXPORT_FIELDS)
+    writer.writerows(lines)
+    text.detach()
+
+
+def _write_xlsx(lines, fileobj):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise RuntimeError("Для выгрузки в XLSX нужен пакет openpyxl") from None
+    # В режиме write_only строки не накапливаются в памяти
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Лабораторная №1')
+    sheet.append(EXPORT_FIELDS)
+    for line in lines:
+        sheet.append(line)
+    workbook.save(fileobj)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--group', help='выгрузить только эту группу')
+    parser.add_argument('--format', choices=('csv', 'xlsx'), default='csv')
+    parser.add_argument('--output', required=True, help='путь к файлу выгрузки')
+    parser.add_argument('--new', action='store_true', help='только ответы, изменённые с прошлой выгрузки')
+    parser.add_argument('--state-file', default='export_state.json', help='где хранить отметку прошлой выгрузки')
+    parser.add_argument('--backend', default=config.STORAGE_BACKEND, choices=('sqlite', 'json'))
+    parser.add_argument('--db', default=config.USER_DATA_DB)
+    parser.add_argument('--json', default=config.USER_DATA_FILE)
+    args = parser.parse_args()
+
+    # Выгрузка только читает данные: базу не создаёт и не переносит в неё user_data.json
+    path = args.db if args.backend == 'sqlite' else args.json
+    if not os.path.exists(path):
+        parser.error(f"Файл с данными пользователей не найден: {path}")
+
+    state = {}
+    if os.path.exists(args.state_file):
+        with open(args.state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    state_key = group_key(args.group) if args.group else '*'
+
+    storage = SQLiteStorage(args.db, read_only=True) if args.backend == 'sqlite' else JsonFileStorage(args.json)
+    try:
+        since = state.get(state_key) if args.new else None
+        with open(args.output, 'wb') as f:
+            result = write_export(iter_submissions(storage, args.group, since), f, args.format)
+    finally:
+        storage.close()
+
+    if result.watermark:
+        state[state_key] = result.watermark
+        with open(args.state_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=4)
+    print(f"Выгружено записей: {result.count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,30 @@
 import os
-import time
 from dotenv import load_dotenv
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ParseMode, ChatAction, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext, ConversationHandler, CallbackQueryHandler
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ParseMode, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.utils.request import Request
+from apscheduler.executors.pool import ThreadPoolExecutor as SchedulerThreadPool
+from telegram.ext import Updater, ExtBot, JobQueue, TypeHandler, CommandHandler, MessageHandler, Filters, CallbackContext, ConversationHandler, CallbackQueryHandler
 import re
 import json
+import html
+import tempfile
 import logging
+import threading
+from queue import Queue
+from config import USER_DATA_FILE, USER_DATA_DB, STORAGE_BACKEND, BROADCAST_DB, PERSISTENCE_DB
+from storage import create_storage
+from broadcast import BroadcastStore, BroadcastManager
+import scripts
+from scripts import MessageScript
+from media import MediaRegistry
+import metrics
+from persistence import SQLitePersistence
+from directory import UserDirectory, group_key
+from records import UserRecord, RecordCache
+from export import iter_submissions, write_export
+from search import SearchEngine
+from dispatch import AsyncioDispatcher
+from admission import AdmissionControl
 
 # Включение логирования
 logging.basicConfig(
@@ -17,6 +36,8 @@ logger = logging.getLogger(__name__)
 # Загрузка переменных из .env файла
 load_dotenv()
 TOKEN = os.getenv('TELEGRAM_TOKEN')
+# Адрес Bot API, например локального сервера Bot API или заглушки для тестов
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
 ADMIN_IDS = list(map(int, os.getenv('ADMIN_IDS').split(',')))
 
 # Проверка наличия токена
@@ -24,36 +45,98 @@ if not TOKEN or not ADMIN_IDS:
     raise ValueError("Необходимо указать TELEGRAM_TOKEN и ADMIN_IDS в файле .env")
 
 # Пути к файлам
-USER_DATA_FILE = 'user_data.json'
 PHOTO_PATH = 'ekolina.jpg'
+MEDIA_CACHE_FILE = os.getenv('MEDIA_CACHE_FILE', 'media_cache.json')
+# Учебные материалы для поиска ответов и каталог с построенным индексом
+SEARCH_MATERIALS_DIR = os.getenv('SEARCH_MATERIALS_DIR', 'materials')
+SEARCH_INDEX_DIR = os.getenv('SEARCH_INDEX_DIR', 'search_index')
+SEARCH_REFRESH_INTERVAL = 60
+
+# Сколько записей пользователей держать в памяти, остальные читаются из хранилища по запросу
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+
+# Порт локального HTTP-сервера с метриками Prometheus (без него метрики не собираются)
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+# Число потоков диспетчера для run_async и потоков JobQueue, из которых отправляются сценарии сообщений
+DISPATCHER_WORKERS = 4
+JOB_QUEUE_WORKERS = 10
+# Режим диспетчера: threads (обычный диспетчер PTB) или asyncio (параллельно по чатам,
+# по порядку внутри чата); DISPATCH_CONCURRENCY - сколько обновлений обрабатывается одновременно
+DISPATCH_MODE = os.getenv('DISPATCH_MODE', 'threads')
+DISPATCH_CONCURRENCY = int(os.getenv('DISPATCH_CONCURRENCY', '64'))
+
+# Параметры рассылки: лимит Telegram около 30 сообщений в секунду на бота
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '8'))
+
+# Допуск обновлений: частота сообщений от одного пользователя, общая частота обновлений
+# и размер очереди, после которого новые обновления сбрасываются
+USER_UPDATE_RATE = float(os.getenv('USER_UPDATE_RATE', '1'))
+USER_UPDATE_BURST = int(os.getenv('USER_UPDATE_BURST', '5'))
+GLOBAL_UPDATE_RATE = float(os.getenv('GLOBAL_UPDATE_RATE', '100'))
+MAX_UPDATE_BACKLOG = int(os.getenv('MAX_UPDATE_BACKLOG', '1000'))
+
+# Номер процесса-обработчика и число процессов в режиме webhook (их запускает webhook.py)
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', '0'))
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+if SHARD_COUNT > 1 and STORAGE_BACKEND != 'sqlite':
+    raise ValueError("Несколько процессов-обработчиков могут работать только с хранилищем sqlite")
 
 # Константы для состояний
 ASK_NAME, ASK_FACULTY, ASK_GROUP, ASK_QUESTION, LAB1_OBJECT, LAB1_BENEFIT1, LAB1_BENEFIT2, LAB1_BENEFIT3, LAB1_CONFIRM, LAB1_CHANGE = range(10)
+STATE_NAMES = {
+    ASK_NAME: 'ASK_NAME',
+    ASK_FACULTY: 'ASK_FACULTY',
+    ASK_GROUP: 'ASK_GROUP',
+    ASK_QUESTION: 'ASK_QUESTION',
+    LAB1_OBJECT: 'LAB1_OBJECT',
+    LAB1_BENEFIT1: 'LAB1_BENEFIT1',
+    LAB1_BENEFIT2: 'LAB1_BENEFIT2',
+    LAB1_BENEFIT3: 'LAB1_BENEFIT3',
+    LAB1_CONFIRM: 'LAB1_CONFIRM',
+    LAB1_CHANGE: 'LAB1_CHANGE',
+}
 
 # Класс для работы с данными пользователей
+# Записи читаются из хранилища по запросу, в памяти держится кэш недавно активных пользователей
 class UserDataManager:
-    def __init__(self, file_path):
-        self.file_path = file_path
-        self.user_data = self.load_user_data()
-
-    def load_user_data(self):
-        if os.path.exists(self.file_path):
-            with open(self.file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
-
-    def save_user_data(self):
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.user_data, f, ensure_ascii=False, indent=4)
+    def __init__(self, storage, excluded_ids=(), cache_size=10000):
+        self.storage = storage
+        self.directory = UserDirectory(storage, excluded_ids)
+        self.cache = RecordCache(cache_size)
+
+    def _get_record(self, user_id):
+        record = self.cache.get(user_id)
+        if record is None:
+            data = self.storage.get(user_id)
+            if data is None:
+                return None
+            record = UserRecord.from_dict(data)
+            self.cache.put(user_id, record)
+        return record
+
+    def has_user(self, user_id):
+        return self._get_record(int(user_id)) is not None
 
     def get_user_data(self, user_id):
-        return self.user_data.get(str(user_id), {})
+        record = self._get_record(int(user_id))
+        return record.to_dict() if record else {}
 
     def update_user_data(self, user_id, data):
-        self.user_data[str(user_id)] = data
-        self.save_user_data()
+        self.storage.put(user_id, data)
+        self.cache.put(int(user_id), UserRecord.from_dict(data))
 
-user_data_manager = UserDataManager(USER_DATA_FILE)
+user_data_manager = UserDataManager(
+    create_storage(STORAGE_BACKEND, USER_DATA_FILE, USER_DATA_DB), excluded_ids=ADMIN_IDS, cache_size=USER_CACHE_SIZE
+)
+media_registry = MediaRegistry(MEDIA_CACHE_FILE)
+# Поисковый индекс строит только первый процесс, остальные перечитывают его с диска
+search_engine = SearchEngine(SEARCH_MATERIALS_DIR, SEARCH_INDEX_DIR, writer=SHARD_INDEX == 0)
+# Ограничение Bot API общее для бота, поэтому скорость рассылки делится между процессами
+broadcast_manager = BroadcastManager(
+    BroadcastStore(BROADCAST_DB), rate=BROADCAST_RATE / SHARD_COUNT, workers=BROADCAST_WORKERS
+)
 
 # Проверка формата ФИО
 def check_full_name(full_name):
@@ -63,7 +146,8 @@ def check_full_name(full_name):
 # Начало общения с пользователем
 def start(update: Update, context: CallbackContext) -> int:
     user_id = update.effective_user.id
-    if str(user_id) in user_data_manager.user_data:
+    broadcast_manager.store.unblock(user_id)
+    if user_data_manager.has_user(user_id):
         update.message.reply_text("Итак, чем я могу вам помочь? 🐭")
         show_main_menu(update)
         return ConversationHandler.END
@@ -74,7 +158,7 @@ def start(update: Update, context: CallbackContext) -> int:
         "Давайте познакомимся 🤩\n"
         "Как тебя зовут? Напиши, пожалуйста, свою фамилию, имя и отчество."
     )
-    context.bot.send_photo(chat_id=update.effective_chat.id, photo=open(PHOTO_PATH, 'rb'), caption=greeting_text, parse_mode=ParseMode.HTML)
+    media_registry.send_photo(context.bot, update.effective_chat.id, PHOTO_PATH, caption=greeting_text, parse_mode=ParseMode.HTML)
     return ASK_NAME
 
 # Обработка имени пользователя
@@ -121,20 +205,32 @@ def show_main_menu(update: Update):
         [KeyboardButton('🔎 Найти ответ на вопрос')],
         [KeyboardButton('🔬 Помочь с лабораторными')]
     ], resize_keyboard=True)
-    update.message.reply_text("Выберите действие:", reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    update.effective_message.reply_text("Выберите действие:", reply_markup=reply_markup, parse_mode=ParseMode.HTML)
 
 # Обработка кнопки "Найти ответ на вопрос"
 def ask_question(update: Update, context: CallbackContext) -> int:
-    update.message.reply_text("Задавай свой вопрос, а я пролистаю весь интернет, чтобы ответить 🔎\n"
-                              "*Мой ИИ может допускать ошибки, поэтому рекомендую проверять важную информацию*", parse_mode=ParseMode.HTML)
+    update.message.reply_text("Задавай свой вопрос, а я поищу ответ в учебных материалах курса 🔎\n"
+                              "<i>Я подбираю подходящие фрагменты материалов, поэтому рекомендую проверять важную информацию</i>", parse_mode=ParseMode.HTML)
     return ASK_QUESTION
 
 # Обработка вопроса пользователя
 def handle_question(update: Update, context: CallbackContext) -> int:
-    update.message.reply_text("Извините, но функция поиска ответов временно недоступна. Пожалуйста, попробуйте позже.", parse_mode=ParseMode.HTML)
+    results = search_engine.search(update.message.text)
+    if results:
+        # Фрагменты обрезаются, чтобы ответ уложился в лимит Telegram на длину сообщения
+        answer = "<b>Вот что я нашла</b> 🔎\n\n" + "\n\n".join(
+            f"{html.escape(text[:1000])}\n<i>Источник: {html.escape(source)}</i>" for text, source, _ in results
+        )
+    else:
+        answer = "К сожалению, я не нашла ответа в учебных материалах. Попробуйте сформулировать вопрос иначе."
+    update.message.reply_text(answer, parse_mode=ParseMode.HTML)
     show_main_menu(update)
     return ConversationHandler.END
 
+# Периодическая проверка изменений в учебных материалах
+def refresh_search_index(context: CallbackContext):
+    search_engine.refresh()
+
 # Обработка кнопки "Помочь с лабораторными"
 def handle_lab_work(update: Update, context: CallbackContext):
     update.message.reply_text("<b>Добро пожаловать в мир лабораторных работ</b> 🙂", parse_mode=ParseMode.HTML)
@@ -150,6 +246,25 @@ def get_lab_work_keyboard():
     ]
     return InlineKeyboardMarkup(keyboard)
 
+# Сценарий вступления к лабораторной работе №1
+LAB1_INTRO_SCRIPT = MessageScript([
+    scripts.typing(),
+    scripts.photo('https://drive.google.com/uc?export=view&id=1zv_PACb5zO436uyR-wsA2-ldezXgjy_A', delay=1.5, caption="Вам необходимо провести анализ личного вклада в сокращение процента захораниваемых отходов. Данный анализ включает 3 пункта:", parse_mode=ParseMode.HTML),
+    scripts.typing(delay=1.5),
+    scripts.text("1. Проведите анализ возможности реализации раздельного сбора Вами лично на примере любого объекта, заполните Таблицу 1. Вы можете выбрать: дом, квартиру, дачу, общежитие, или даже ваше место работы, если оно конечно уже есть.\n2. Используя <a href='https://recyclemap.ru/'>https://recyclemap.ru/</a> (если ваш город есть в данном сервисе) или другой доступный вам ресурс, найдите ближайшие к вам точки раздельного сбора. Заполните Таблицу 2, указав точки и виды отходов, которые вы разделяете/сдаете или могли бы это делать в своем городе.\n3. Уже зная состав своей мусорной корзины, используйте пять простых принципов (5R), которые лежат в основе безотходного образа жизни и заполните таблицу 3. Постарайтесь не оставлять пустых ячеек в столбце “Могу делать в будущем”, вы наверняка можете больше, чем кажется.", delay=2, parse_mode=ParseMode.HTML),
+    scripts.typing(delay=1.5),
+    scripts.photo('https://drive.google.com/uc?export=view&id=1Ua7RYLVDSdQYfpViCqn8Ok8AqD1syteQ', delay=2, caption="Начнем с таблицы № 1 – Анализ возможности реализации раздельного сбора.", parse_mode=ParseMode.HTML),
+    scripts.typing(delay=1.5),
+    scripts.text("Укажите <b>объект</b>, который вы будете анализировать", delay=2, parse_mode=ParseMode.HTML),
+], media=media_registry)
+
+# Отправка ответа после индикатора набора текста без блокировки потока
+def reply_after_typing(update: Update, context: CallbackContext, text, **kwargs):
+    MessageScript([
+        scripts.typing(),
+        scripts.text(text, delay=1.5, parse_mode=ParseMode.HTML, **kwargs),
+    ]).play(context.job_queue, update.effective_chat.id)
+
 # Обработка выбора лабораторной работы
 def lab_work_selection(update: Update, context: CallbackContext):
     query = update.callback_query
@@ -159,31 +274,14 @@ def lab_work_selection(update: Update, context: CallbackContext):
     if selected_lab == 'lab1':
         query.edit_message_text(text="Вы выбрали Лабораторная работа №1.", parse_mode=ParseMode.HTML)
         # Отправка сообщений, связанных с лабораторной работой №1
-        context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-        time.sleep(1.5)
-        context.bot.send_photo(chat_id=query.message.chat_id, photo='https://drive.google.com/uc?export=view&id=1zv_PACb5zO436uyR-wsA2-ldezXgjy_A', caption="Вам необходимо провести анализ личного вклада в сокращение процента захораниваемых отходов. Данный анализ включает 3 пункта:", parse_mode=ParseMode.HTML)
-
-        time.sleep(1.5)
-        context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-        time.sleep(2)
-        context.bot.send_message(chat_id=query.message.chat_id, text="1. Проведите анализ возможности реализации раздельного сбора Вами лично на примере любого объекта, заполните Таблицу 1. Вы можете выбрать: дом, квартиру, дачу, общежитие, или даже ваше место работы, если оно конечно уже есть.\n2. Используя <a href='https://recyclemap.ru/'>https://recyclemap.ru/</a> (если ваш город есть в данном сервисе) или другой доступный вам ресурс, найдите ближайшие к вам точки раздельного сбора. Заполните Таблицу 2, указав точки и виды отходов, которые вы разделяете/сдаете или могли бы это делать в своем городе.\n3. Уже зная состав своей мусорной корзины, используйте пять простых принципов (5R), которые лежат в основе безотходного образа жизни и заполните таблицу 3. Постарайтесь не оставлять пустых ячеек в столбце “Могу делать в будущем”, вы наверняка можете больше, чем кажется.", parse_mode=ParseMode.HTML)
-
-        time.sleep(1.5)
-        context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-        time.sleep(2)
-        context.bot.send_photo(chat_id=query.message.chat_id, photo='https://drive.google.com/uc?export=view&id=1Ua7RYLVDSdQYfpViCqn8Ok8AqD1syteQ', caption="Начнем с таблицы № 1 – Анализ возможности реализации раздельного сбора.", parse_mode=ParseMode.HTML)
-
-        time.sleep(1.5)
-        context.bot.send_chat_action(chat_id=query.message.chat_id, action=ChatAction.TYPING)
-        time.sleep(2)
-        context.bot.send_message(chat_id=query.message.chat_id, text="Укажите <b>объект</b>, который вы будете анализировать", parse_mode=ParseMode.HTML)
+        LAB1_INTRO_SCRIPT.play(context.job_queue, query.message.chat_id)
         return LAB1_OBJECT
     elif selected_lab == 'lab2':
         query.edit_message_text(text="Вы выбрали Лабораторная работа №2.", parse_mode=ParseMode.HTML)
-        show_main_menu(query.message)
+        show_main_menu(update)
     elif selected_lab == 'lab3':
         query.edit_message_text(text="Вы выбрали Лабораторная работа №3.", parse_mode=ParseMode.HTML)
-        show_main_menu(query.message)
+        show_main_menu(update)
 
 # Обработка выбора объекта для лабораторной работы №1
 def lab1_object(update: Update, context: CallbackContext) -> int:
@@ -192,9 +290,7 @@ def lab1_object(update: Update, context: CallbackContext) -> int:
     user_data['lab1_object'] = update.message.text
     user_data_manager.update_user_data(user_id, user_data)
 
-    context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-    time.sleep(1.5)
-    update.message.reply_text("Переходим к первому вопросу – <b>Какие выгоды (экономические, социальные, экологические) вы и все участники процесса смогут получить благодаря раздельному сбору на выбранном объекте?</b>\nУкажите первый пункт из трех 👇", parse_mode=ParseMode.HTML)
+    reply_after_typing(update, context, "Переходим к первому вопросу – <b>Какие выгоды (экономические, социальные, экологические) вы и все участники процесса смогут получить благодаря раздельному сбору на выбранном объекте?</b>\nУкажите первый пункт из трех 👇")
     return LAB1_BENEFIT1
 
 # Обработка первого пункта выгоды для лабораторной работы №1
@@ -204,9 +300,7 @@ def lab1_benefit1(update: Update, context: CallbackContext) -> int:
     user_data['lab1_benefit1'] = update.message.text
     user_data_manager.update_user_data(user_id, user_data)
 
-    context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-    time.sleep(1.5)
-    update.message.reply_text("Хорошо 👌 Укажите второй пункт из трех 👇", parse_mode=ParseMode.HTML)
+    reply_after_typing(update, context, "Хорошо 👌 Укажите второй пункт из трех 👇")
     return LAB1_BENEFIT2
 
 # Обработка второго пункта выгоды для лабораторной работы №1
@@ -216,9 +310,7 @@ def lab1_benefit2(update: Update, context: CallbackContext) -> int:
     user_data['lab1_benefit2'] = update.message.text
     user_data_manager.update_user_data(user_id, user_data)
 
-    context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-    time.sleep(1.5)
-    update.message.reply_text("Супер 👍 Укажите третий пункт 👇", parse_mode=ParseMode.HTML)
+    reply_after_typing(update, context, "Супер 👍 Укажите третий пункт 👇")
     return LAB1_BENEFIT3
 
 # Обработка третьего пункта выгоды для лабораторной работы №1
@@ -228,8 +320,6 @@ def lab1_benefit3(update: Update, context: CallbackContext) -> int:
     user_data['lab1_benefit3'] = update.message.text
     user_data_manager.update_user_data(user_id, user_data)
 
-    context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
-    time.sleep(1.5)
     benefits = (
         f"<b>Преимущества:</b>\n"
         f"Пункт 1: {user_data['lab1_benefit1']}\n"
@@ -243,7 +333,7 @@ def lab1_benefit3(update: Update, context: CallbackContext) -> int:
         [InlineKeyboardButton("Хочу добавить пункт", callback_data='confirm_add')]
     ]
     reply_markup = InlineKeyboardMarkup(buttons)
-    update.message.reply_text(benefits, reply_markup=reply_markup, parse_mode=ParseMode.HTML)
+    reply_after_typing(update, context, benefits, reply_markup=reply_markup)
     return LAB1_CONFIRM
 
 # Обработка подтверждения преимуществ
@@ -255,7 +345,7 @@ def lab1_confirm(update: Update, context: CallbackContext) -> int:
 
     if query.data == 'confirm_yes':
         query.edit_message_text(text="Отлично! Лабораторная работа №1 завершена.", parse_mode=ParseMode.HTML)
-        show_main_menu(query.message)
+        show_main_menu(update)
         return ConversationHandler.END
     elif query.data == 'confirm_no':
         query.edit_message_text(text="Какой пункт вы хотите изменить? Укажите номер пункта (1, 2 или 3):", parse_mode=ParseMode.HTML)
@@ -282,13 +372,19 @@ def handle_lab1_confirm_change(update: Update, context: CallbackContext) -> int:
         context.user_data['lab1_edit'] = 'lab1_benefit3'
         return LAB1_BENEFIT3
 
-# Отправка уведомлений
+# Отправка уведомлений: /notify для всех или /notify <группа или факультет>
 def send_notifications(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
     if user_id not in ADMIN_IDS:
         update.message.reply_text("Эта функция доступна только для преподавателей.", parse_mode=ParseMode.HTML)
         return
 
+    target = ' '.join(context.args)
+    if target and not user_data_manager.directory.recipients(target):
+        update.message.reply_text(f"Группа или факультет «{html.escape(target)}» не найдены.", parse_mode=ParseMode.HTML)
+        return
+
+    context.user_data['notification_target'] = target
     context.bot.send_message(chat_id=update.effective_chat.id, text="Что нужно отправить? Введите текст, цифры или отправьте изображение.", parse_mode=ParseMode.HTML)
     context.user_data['awaiting_notification'] = True
 
@@ -296,32 +392,99 @@ def handle_notification(update: Update, context: CallbackContext):
     if context.user_data.get('awaiting_notification'):
         notification_content = update.message.caption if update.message.caption else update.message.text
         photo_file_id = update.message.photo[-1].file_id if update.message.photo else None
-        sent_count = 0
-
-        for user_id in user_data_manager.user_data.keys():
-            if int(user_id) not in ADMIN_IDS:
-                if photo_file_id:
-                    context.bot.send_photo(chat_id=int(user_id), photo=photo_file_id, caption=notification_content, parse_mode=ParseMode.HTML)
-                elif notification_content:
-                    context.bot.send_message(chat_id=int(user_id), text=notification_content, parse_mode=ParseMode.HTML)
-                sent_count += 1
 
+        recipients = user_data_manager.directory.recipients(context.user_data.get('notification_target'))
         context.user_data['awaiting_notification'] = False
-        # Отправка уведомления администратору
-        update.message.reply_text(f"Сообщение отправлено {sent_count} пользователям.", parse_mode=ParseMode.HTML)
+        if photo_file_id or notification_content:
+            # Рассылка выполняется в фоне, прогресс приходит администратору отдельным сообщением
+            broadcast_manager.submit(update.effective_chat.id, notification_content, photo_file_id, recipients)
+
+# Выгрузка ответов по лабораторной работе №1: /export [группа] [csv|xlsx] [new]
+# new - только ответы, изменившиеся с прошлой выгрузки этой группы
+def export_submissions(update: Update, context: CallbackContext):
+    if update.effective_user.id not in ADMIN_IDS:
+        update.message.reply_text("Эта функция доступна только для преподавателей.", parse_mode=ParseMode.HTML)
+        return
+
+    file_format, only_new, group = 'csv', False, None
+    for arg in context.args:
+        if arg.lower() in ('csv', 'xlsx'):
+            file_format = arg.lower()
+        elif arg.lower() == 'new':
+            only_new = True
+        else:
+            group = arg
+
+    export_marks = context.user_data.setdefault('export_marks', {})
+    mark_key = group_key(group) if group else '*'
+    since = export_marks.get(mark_key) if only_new else None
+    with tempfile.TemporaryFile() as f:
+        try:
+            result = write_export(iter_submissions(user_data_manager.storage, group, since), f, file_format)
+        except (ValueError, RuntimeError) as e:
+            update.message.reply_text(html.escape(str(e)), parse_mode=ParseMode.HTML)
+            return
+        if not result.count:
+            update.message.reply_text("Нет ответов для выгрузки.", parse_mode=ParseMode.HTML)
+            return
+        f.seek(0)
+        filename = f"lab1_{group or 'all'}.{file_format}"
+        context.bot.send_document(chat_id=update.effective_chat.id, document=f, filename=filename, caption=f"Записей: {result.count}")
+
+    if result.watermark:
+        export_marks[mark_key] = result.watermark
 
 # Обработка ошибок
 def error_handler(update: Update, context: CallbackContext):
     logger.error(msg="Exception while handling an update:", exc_info=context.error)
-    update.message.reply_text('Произошла ошибка. Пожалуйста, попробуйте еще раз позже.', parse_mode=ParseMode.HTML)
-
-def main():
-    updater = Updater(TOKEN, use_context=True)
+    # Ошибки в задачах JobQueue приходят без update
+    if not isinstance(update, Update) or not update.effective_message:
+        return
+    update.effective_message.reply_text('Произошла ошибка. Пожалуйста, попробуйте еще раз позже.', parse_mode=ParseMode.HTML)
+
+# Сборка бота со всеми обработчиками (используется также нагрузочным тестом)
+def build_updater():
+    request_class = metrics.InstrumentedRequest if metrics.ENABLED else Request
+    persistence = SQLitePersistence(PERSISTENCE_DB)
+    # Соединения с Bot API переиспользуются (keep-alive), если пул покрывает все потоки, которые отправляют
+    # сообщения: обработчики, run_async, JobQueue и рассылку; ещё 4 - диспетчер, опрос, прогресс рассылки и main
+    if DISPATCH_MODE == 'asyncio':
+        # Сценарии сообщений отправляются из JobQueue, поэтому её пул потоков расширяется вместе с обработчиками
+        job_queue_workers = DISPATCH_CONCURRENCY
+        con_pool_size = DISPATCH_CONCURRENCY + DISPATCHER_WORKERS + job_queue_workers + BROADCAST_WORKERS + 4
+        bot = ExtBot(TOKEN, base_url=TELEGRAM_API_URL, request=request_class(con_pool_size=con_pool_size))
+        job_queue = JobQueue()
+        job_queue.scheduler.add_executor(SchedulerThreadPool(job_queue_workers), 'default')
+        dispatcher = AsyncioDispatcher(
+            bot, Queue(), workers=DISPATCHER_WORKERS, job_queue=job_queue, persistence=persistence,
+            concurrency=DISPATCH_CONCURRENCY
+        )
+        job_queue.set_dispatcher(dispatcher)
+        updater = Updater(dispatcher=dispatcher, workers=None)
+    elif DISPATCH_MODE == 'threads':
+        con_pool_size = DISPATCHER_WORKERS + JOB_QUEUE_WORKERS + BROADCAST_WORKERS + 4
+        bot = ExtBot(TOKEN, base_url=TELEGRAM_API_URL, request=request_class(con_pool_size=con_pool_size))
+        updater = Updater(bot=bot, workers=DISPATCHER_WORKERS, use_context=True, persistence=persistence)
+        updater.job_queue.scheduler.add_executor(SchedulerThreadPool(JOB_QUEUE_WORKERS), 'default')
+    else:
+        raise ValueError(f"Неизвестный режим диспетчера: {DISPATCH_MODE}")
     dispatcher = updater.dispatcher
 
+    # Допуск обновлений выполняется раньше всех остальных обработчиков
+    admission = AdmissionControl(
+        backlog=lambda: dispatcher.update_queue.unfinished_tasks, exempt_ids=ADMIN_IDS,
+        user_rate=USER_UPDATE_RATE, user_burst=USER_UPDATE_BURST, global_rate=GLOBAL_UPDATE_RATE / SHARD_COUNT,
+        max_backlog=MAX_UPDATE_BACKLOG
+    )
+    dispatcher.add_handler(TypeHandler(Update, admission.admit), group=-1)
+
     # Обработчик команды /start
     conv_handler = ConversationHandler(
-        entry_points=[CommandHandler('start', start)],
+        entry_points=[
+            CommandHandler('start', start),
+            MessageHandler(Filters.regex('^🔎 Найти ответ на вопрос$'), ask_question),
+            CallbackQueryHandler(lab_work_selection, pattern='^lab[1-3]$')
+        ],
         states={
             ASK_NAME: [MessageHandler(Filters.text & ~Filters.command, ask_name)],
             ASK_FACULTY: [MessageHandler(Filters.text & ~Filters.command, ask_faculty)],
@@ -337,7 +500,8 @@ def main():
             LAB1_CHANGE: [MessageHandler(Filters.text & ~Filters.command, handle_lab1_confirm_change)]
         },
         fallbacks=[CommandHandler('start', start)],
-        per_message=True  # Добавляем per_message=True
+        name='main_conversation',
+        persistent=True
     )
     dispatcher.add_handler(conv_handler)
 
@@ -347,11 +511,54 @@ def main():
     dispatcher.add_handler(CallbackQueryHandler(lab_work_selection, pattern='^lab[1-3]$'))
     dispatcher.add_handler(CommandHandler('notify', send_notifications))
     dispatcher.add_handler(CommandHandler('stop_notify', handle_notification))
-    dispatcher.add_handler(MessageHandler(Filters.text | Filters.photo, handle_notification))
+    dispatcher.add_handler(CommandHandler('export', export_submissions, run_async=True))
+    # Текст рассылки принимается только от администраторов
+    dispatcher.add_handler(MessageHandler((Filters.text | Filters.photo) & Filters.user(ADMIN_IDS), handle_notification))
     dispatcher.add_error_handler(error_handler)
+    updater.job_queue.run_repeating(refresh_search_index, interval=SEARCH_REFRESH_INTERVAL, first=SEARCH_REFRESH_INTERVAL)
 
+    if metrics.ENABLED:
+        metrics.instrument_dispatcher(dispatcher, STATE_NAMES)
+        metrics.instrument_storage(user_data_manager.storage)
+    return updater
+
+def main():
+    if METRICS_PORT:
+        metrics.enable()
+        metrics.start_server(int(METRICS_PORT))
+    updater = build_updater()
+    broadcast_manager.start(updater.bot)
     updater.start_polling()
     updater.idle()
+    broadcast_manager.stop()
+    user_data_manager.storage.close()
+
+# Процесс-обработчик в режиме webhook: обновления в виде JSON приходят из очереди маршрутизатора,
+# None в очереди означает остановку
+def run_shard(updates):
+    if METRICS_PORT:
+        metrics.enable()
+        metrics.start_server(int(METRICS_PORT) + SHARD_INDEX)
+    updater = build_updater()
+    dispatcher = updater.dispatcher
+    broadcast_manager.start(updater.bot, resume=SHARD_INDEX == 0)
+    updater.job_queue.start()
+    dispatcher_thread = threading.Thread(target=dispatcher.start, name=f'dispatcher-{SHARD_INDEX}')
+    dispatcher_thread.start()
+    logger.info("Обработчик %d из %d запущен", SHARD_INDEX + 1, SHARD_COUNT)
+
+    while True:
+        payload = updates.get()
+        if payload is None:
+            break
+        dispatcher.update_queue.put(Update.de_json(json.loads(payload), updater.bot))
+
+    dispatcher.stop()
+    dispatcher_thread.join()
+    updater.job_queue.stop()
+    updater.persistence.flush()
+    broadcast_manager.stop()
+    user_data_manager.storage.close()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,98 @@
+import os
+import json
+import hashlib
+import threading
+import logging
+from telegram.error import BadRequest
+
+logger = logging.getLogger(__name__)
+
+
+# Реестр медиафайлов: каждый файл загружается в Telegram один раз,
+# дальше отправляется по сохранённому file_id.
+# Ключ кэша - хэш содержимого для локальных файлов или сам URL для ссылок.
+class MediaRegistry:
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._file_ids = self._load()
+        self._hashes = {}
+        # Блокировки загрузки по ключам: файл загружает первый отправитель, остальные ждут его file_id
+        self._upload_locks = {}
+
+    def _load(self):
+        if os.path.exists(self.cache_path):
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return {}
+
+    def _save(self):
+        # Временный файл свой у каждого процесса, если кэш общий для нескольких процессов
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._file_ids, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, self.cache_path)
+
+    def _key(self, source):
+        if not os.path.isfile(source):
+            return 'url:' + source
+        # Хэш пересчитывается только при изменении файла
+        mtime = os.path.getmtime(source)
+        cached = self._hashes.get(source)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(source, 'rb') as f:
+            key = 'sha256:' + hashlib.sha256(f.read()).hexdigest()
+        self._hashes[source] = (mtime, key)
+        return key
+
+    def _remember(self, key, file_id):
+        with self._lock:
+            self._file_ids[key] = file_id
+            self._save()
+
+    # Удаляет file_id, только если его ещё не заменил file_id новой загрузки
+    def _forget(self, key, file_id):
+        with self._lock:
+            if self._file_ids.get(key) == file_id:
+                del self._file_ids[key]
+                self._save()
+
+    def _upload_lock(self, key):
+        with self._lock:
+            return self._upload_locks.setdefault(key, threading.Lock())
+
+    # Отправка по сохранённому file_id; None, если его нет или Telegram его не принял
+    def _send_cached(self, bot, chat_id, key, photo, **kwargs):
+        file_id = self._file_ids.get(key)
+        if not file_id:
+            return None
+        try:
+            return bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        except BadRequest as e:
+            # Telegram не принял сохранённый file_id, загружаем файл заново
+            if 'file' not in str(e).lower():
+                raise
+            logger.warning("Устаревший file_id для %s: %s", photo, e)
+            self._forget(key, file_id)
+            return None
+
+    def send_photo(self, bot, chat_id, photo, **kwargs):
+        key = self._key(photo)
+        message = self._send_cached(bot, chat_id, key, photo, **kwargs)
+        if message is not None:
+            return message
+
+        with self._upload_lock(key):
+            # Пока ждали блокировку, файл мог загрузить другой поток
+            message = self._send_cached(bot, chat_id, key, photo, **kwargs)
+            if message is not None:
+                return message
+            if os.path.isfile(photo):
+                with open(photo, 'rb') as f:
+                    message = bot.send_photo(chat_id=chat_id, photo=f, **kwargs)
+            else:
+                message = bot.send_photo(chat_id=chat_id, photo=photo, **kwargs)
+            if message.photo:
+                self._remember(key, message.photo[-1].file_id)
+        return message
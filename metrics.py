@@ -0,0 +1,232 @@
+import time
+import bisect
+import threading
+import functools
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from telegram.ext import ConversationHandler, DispatcherHandlerStop
+from telegram.utils.request import Request
+
+logger = logging.getLogger(__name__)
+
+# Метрики собираются только после вызова enable(): без него обработчики не оборачиваются
+ENABLED = False
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+# Счётчик с метками
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in items]
+
+
+# Гистограмма с метками и фиксированными границами корзин
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        result = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                result.append((self.name + '_bucket', _format_labels(self.labelnames, key, f'le="{le}"'), cumulative))
+            result.append((self.name + '_sum', _format_labels(self.labelnames, key), total))
+            result.append((self.name + '_count', _format_labels(self.labelnames, key), count))
+        return result
+
+
+# Значение, которое вычисляется в момент запроса метрик
+class CallbackMetric:
+    def __init__(self, name, documentation, kind, func):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.func = func
+
+    def samples(self):
+        return [(self.name, '', self.func())]
+
+
+_registry = []
+
+
+def register(metric):
+    _registry.append(metric)
+    return metric
+
+
+def render():
+    lines = []
+    for metric in list(_registry):
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+HANDLER_LATENCY = register(Histogram(
+    'ecobot_handler_duration_seconds', 'Время работы обработчика обновления', ('handler', 'state')
+))
+HANDLER_ERRORS = register(Counter(
+    'ecobot_handler_errors_total', 'Исключения в обработчиках', ('handler', 'state')
+))
+API_LATENCY = register(Histogram(
+    'ecobot_bot_api_duration_seconds', 'Время вызова Bot API', ('method',)
+))
+API_ERRORS = register(Counter(
+    'ecobot_bot_api_errors_total', 'Ошибки вызовов Bot API', ('method', 'error')
+))
+ADMISSION_DROPPED = register(Counter(
+    'ecobot_admission_dropped_total', 'Обновления, отброшенные до обработчиков', ('reason',)
+))
+ADMISSION_DELAYED = register(Counter(
+    'ecobot_admission_delayed_total', 'Обновления, придержанные общим ограничением частоты'
+))
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+# Замер времени работы обработчика
+def timed_callback(callback, state):
+    handler_name = getattr(callback, '__name__', type(callback).__name__)
+
+    @functools.wraps(callback)
+    def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return callback(update, context)
+        except DispatcherHandlerStop:
+            # Штатная остановка обработки (например, допуск обновлений отбросил его), а не ошибка
+            raise
+        except Exception:
+            HANDLER_ERRORS.inc(handler=handler_name, state=state)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, handler=handler_name, state=state)
+
+    return wrapper
+
+
+def _instrument_handler(handler, state, state_names):
+    if isinstance(handler, ConversationHandler):
+        for inner in handler.entry_points:
+            _instrument_handler(inner, 'ENTRY', state_names)
+        for inner_state, inner_handlers in handler.states.items():
+            for inner in inner_handlers:
+                _instrument_handler(inner, state_names.get(inner_state, inner_state), state_names)
+        for inner in handler.fallbacks:
+            _instrument_handler(inner, 'FALLBACK', state_names)
+    else:
+        handler.callback = timed_callback(handler.callback, state)
+
+
+def instrument_dispatcher(dispatcher, state_names=None):
+    """Оборачивает все зарегистрированные обработчики замером времени.
+
+    state_names сопоставляет числовые состояния ConversationHandler их именам для меток.
+    """
+    for handlers in dispatcher.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler, 'NONE', state_names or {})
+
+    # Диспетчер на asyncio сразу разбирает очередь по чатам, поэтому считаются все ещё не обработанные обновления
+    register(CallbackMetric(
+        'ecobot_update_queue_depth', 'Обновления, ожидающие обработки диспетчером', 'gauge',
+        lambda: dispatcher.update_queue.unfinished_tasks
+    ))
+
+
+def instrument_storage(storage):
+    register(CallbackMetric('ecobot_storage_writes_total', 'Записи в хранилище', 'counter', lambda: storage.writes))
+    register(CallbackMetric('ecobot_storage_bytes_written_total', 'Байты, записанные в хранилище', 'counter', lambda: storage.bytes_written))
+    register(CallbackMetric('ecobot_storage_fsyncs_total', 'Синхронизации хранилища с диском', 'counter', lambda: storage.fsyncs))
+
+
+# Request с замером времени и ошибок каждого вызова Bot API
+class InstrumentedRequest(Request):
+    def post(self, url, data, timeout=None):
+        method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return super().post(url, data, timeout=timeout)
+        except Exception as e:
+            API_ERRORS.inc(method=method, error=type(e).__name__)
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, method=method)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# HTTP-сервер с метриками в формате Prometheus на локальном адресе
+def start_server(port, host='127.0.0.1'):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info("Метрики доступны на http://%s:%d/metrics", host, port)
+    return server
@@ -0,0 +1,135 @@
+import json
+import sqlite3
+import threading
+import logging
+from collections import defaultdict
+from telegram.ext import BasePersistence
+
+logger = logging.getLogger(__name__)
+
+
+# Хранение состояний ConversationHandler и context.user_data в SQLite.
+# Изменения копятся в памяти и записываются пачкой раз в flush_interval секунд,
+# причём записываются только изменившиеся записи, а не всё состояние целиком.
+class SQLitePersistence(BasePersistence):
+    def __init__(self, db_path, flush_interval=1.0):
+        super().__init__(store_user_data=True, store_chat_data=False, store_bot_data=False)
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS conversations ('
+            'name TEXT NOT NULL, '
+            'key TEXT NOT NULL, '
+            'state TEXT NOT NULL, '
+            'PRIMARY KEY (name, key));'
+            'CREATE TABLE IF NOT EXISTS user_data ('
+            'user_id INTEGER PRIMARY KEY, '
+            'data TEXT NOT NULL);'
+        )
+
+        self._conversations = {}
+        # Последнее записанное значение user_data, чтобы не писать неизменившиеся записи
+        self._user_snapshots = {}
+        self._dirty_conversations = set()
+        self._dirty_users = set()
+
+        self._stop_event = threading.Event()
+        self._flush_thread = threading.Thread(
+            target=self._flush_loop, args=(flush_interval,), name='persistence-flush', daemon=True
+        )
+        self._flush_thread.start()
+
+    # Вызывается диспетчером один раз при запуске
+    def get_user_data(self):
+        user_data = defaultdict(dict)
+        with self._lock:
+            for user_id, data in self._conn.execute('SELECT user_id, data FROM user_data'):
+                user_data[user_id] = json.loads(data)
+                self._user_snapshots[user_id] = data
+        return user_data
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name):
+        with self._lock:
+            if name not in self._conversations:
+                rows = self._conn.execute('SELECT key, state FROM conversations WHERE name = ?', (name,)).fetchall()
+                self._conversations[name] = {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+            return dict(self._conversations[name])
+
+    def update_conversation(self, name, key, new_state):
+        with self._lock:
+            conversation = self._conversations.setdefault(name, {})
+            if conversation.get(key) == new_state:
+                return
+            if new_state is None:
+                conversation.pop(key, None)
+            else:
+                conversation[key] = new_state
+            self._dirty_conversations.add((name, key))
+
+    def update_user_data(self, user_id, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            if self._user_snapshots.get(user_id) == payload:
+                return
+            self._user_snapshots[user_id] = payload
+            self._dirty_users.add(user_id)
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
+
+    def _flush_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self._flush_dirty()
+            except Exception:
+                logger.exception("Не удалось сохранить состояние диалогов в %s", self.db_path)
+
+    # Запись изменившихся записей одной транзакцией
+    def _flush_dirty(self):
+        with self._lock:
+            if not self._dirty_conversations and not self._dirty_users:
+                return
+            conversations = []
+            for name, key in self._dirty_conversations:
+                state = self._conversations.get(name, {}).get(key)
+                conversations.append((name, json.dumps(list(key)), None if state is None else json.dumps(state)))
+            users = [(user_id, self._user_snapshots[user_id]) for user_id in self._dirty_users]
+
+            # Dirty-наборы очищаются только после COMMIT, при ошибке пачка запишется в следующий раз
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'DELETE FROM conversations WHERE name = ? AND key = ?',
+                    ((name, key) for name, key, state in conversations if state is None)
+                )
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO conversations (name, key, state) VALUES (?, ?, ?)',
+                    (row for row in conversations if row[2] is not None)
+                )
+                self._conn.executemany('INSERT OR REPLACE INTO user_data (user_id, data) VALUES (?, ?)', users)
+                self._conn.execute('COMMIT')
+            except BaseException:
+                if self._conn.in_transaction:
+                    self._conn.execute('ROLLBACK')
+                raise
+            self._dirty_conversations.clear()
+            self._dirty_users.clear()
+
+    def flush(self):
+        self._stop_event.set()
+        self._flush_thread.join()
+        self._flush_dirty()
+        with self._lock:
+            self._conn.close()
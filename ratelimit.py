@@ -0,0 +1,50 @@
+import time
+import threading
+
+
+# Ограничитель частоты по алгоритму token bucket
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Забирает токены, если они есть. Возвращает 0 или время ожидания в секундах."""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, timeout=None):
+        """Ждёт токены. С timeout возвращает False, если за это время они не появились."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if wait > remaining:
+                    return False
+            time.sleep(wait)
+
+    # Приостановка выдачи токенов, например после RetryAfter от Telegram
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            # Время паузы не накапливает токены, после неё отправки идут с обычной частотой
+            self._updated = self._paused_until
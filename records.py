@@ -0,0 +1,63 @@
+import sys
+import threading
+from collections import OrderedDict
+
+# Поля анкеты и лабораторной №1; остальные ключи записи попадают в extra
+RECORD_FIELDS = ('name', 'faculty', 'group', 'lab1_object', 'lab1_benefit1', 'lab1_benefit2', 'lab1_benefit3')
+_FIELD_SET = frozenset(RECORD_FIELDS)
+# Значения, которые повторяются у сотен пользователей и хранятся в одном экземпляре
+_INTERNED_FIELDS = frozenset(('faculty', 'group'))
+
+
+# Компактная запись пользователя: поля в __slots__ вместо словаря на каждого пользователя
+class UserRecord:
+    __slots__ = RECORD_FIELDS + ('extra',)
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, None)
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls()
+        for key, value in data.items():
+            if key not in _FIELD_SET:
+                if record.extra is None:
+                    record.extra = {}
+                record.extra[key] = value
+                continue
+            if key in _INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            setattr(record, key, value)
+        return record
+
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in RECORD_FIELDS if getattr(self, field) is not None}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+# LRU-кэш записей: в памяти держатся только недавно активные пользователи
+class RecordCache:
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            record = self._records.get(user_id)
+            if record is not None:
+                self._records.move_to_end(user_id)
+            return record
+
+    def put(self, user_id, record):
+        with self._lock:
+            self._records[user_id] = record
+            self._records.move_to_end(user_id)
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+
+    def __len__(self):
+        return len(self._records)
@@ -0,0 +1,60 @@
+import os
+import logging
+from collections import namedtuple
+from telegram import ChatAction
+
+logger = logging.getLogger(__name__)
+
+# Множитель пауз между шагами сценария (0 отключает паузы, например для нагрузочных тестов)
+DELAY_SCALE = float(os.getenv('MESSAGE_SCRIPT_DELAY_SCALE', '1'))
+
+# Шаг сценария: пауза перед шагом, метод бота и его аргументы
+ScriptStep = namedtuple('ScriptStep', ['delay', 'method', 'kwargs'])
+
+
+def typing(delay=0):
+    return ScriptStep(delay, 'send_chat_action', {'action': ChatAction.TYPING})
+
+
+def text(text, delay=0, **kwargs):
+    return ScriptStep(delay, 'send_message', dict(kwargs, text=text))
+
+
+def photo(photo, delay=0, **kwargs):
+    return ScriptStep(delay, 'send_photo', dict(kwargs, photo=photo))
+
+
+# Последовательность сообщений, которая проигрывается через JobQueue.
+# Паузы между шагами не занимают поток диспетчера: каждый шаг планирует следующий.
+# Фотографии отправляются через реестр медиафайлов, если он передан.
+class MessageScript:
+    def __init__(self, steps, media=None):
+        self.steps = list(steps)
+        self.media = media
+
+    def play(self, job_queue, chat_id):
+        self._schedule(job_queue, chat_id, 0)
+
+    def _schedule(self, job_queue, chat_id, index):
+        if index >= len(self.steps):
+            return
+        job_queue.run_once(
+            self._run_step,
+            when=self.steps[index].delay * DELAY_SCALE,
+            context=(chat_id, index),
+            name=f'script-{chat_id}',
+            # Шаг не пропускается, даже если очередь задач перегружена и он запустится с опозданием
+            job_kwargs={'misfire_grace_time': None}
+        )
+
+    def _run_step(self, context):
+        chat_id, index = context.job.context
+        step = self.steps[index]
+        try:
+            if step.method == 'send_photo' and self.media:
+                self.media.send_photo(context.bot, chat_id, **step.kwargs)
+            else:
+                getattr(context.bot, step.method)(chat_id=chat_id, **step.kwargs)
+        finally:
+            # Ошибка одного шага не должна обрывать весь сценарий
+            self._schedule(context.job_queue, chat_id, index + 1)
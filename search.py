@@ -0,0 +1,359 @@
+import os
+import re
+import json
+import glob
+import logging
+import threading
+from functools import lru_cache
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Параметры ранжирования BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Версия формата файлов индекса; индекс другого формата строится заново
+INDEX_FORMAT = 2
+
+STOP_WORDS = frozenset(
+    'и в во не что он на я с со как а то все она так его но да ты к у же вы за бы по только ее мне было вот от '
+    'меня еще нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него до вас нибудь опять уж '
+    'вам ведь там потом себя ничего ей может они тут где есть надо ней для мы тебя их чем была сам чтоб без '
+    'будто чего раз тоже себе под будет ж тогда кто этот того потому этого какой совсем ним здесь этом один '
+    'почти мой тем чтобы нее сейчас были куда зачем всех никогда можно при наконец два об другой хоть после '
+    'над больше тот через эти нас про всего них какая много разве три эту моя впрочем хорошо свою этой перед '
+    'иногда лучше чуть том нельзя такой им более всегда конечно всю между это как такое'.split()
+)
+
+_TOKEN_RE = re.compile(r'[а-яёa-z0-9]+')
+
+
+# Стеммер для русского языка по алгоритму Snowball (Портер)
+class RussianStemmer:
+    VOWELS = 'аеиоуыэюя'
+    PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+    ADJECTIVE = ('ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом', 'его', 'ого',
+                 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею')
+    PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+    REFLEXIVE = ('ся', 'сь')
+    VERB = (('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+            ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило',
+             'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'))
+    NOUN = ('а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям',
+            'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я')
+    SUPERLATIVE = ('ейше', 'ейш')
+    DERIVATIONAL = ('ость', 'ост')
+
+    def _regions(self, word):
+        rv = r1 = r2 = len(word)
+        for i in range(1, len(word)):
+            if word[i - 1] in self.VOWELS:
+                rv = i
+                break
+        for i in range(1, len(word)):
+            if word[i - 1] in self.VOWELS and word[i] not in self.VOWELS:
+                r1 = i + 1
+                break
+        for i in range(r1 + 1, len(word)):
+            if word[i - 1] in self.VOWELS and word[i] not in self.VOWELS:
+                r2 = i + 1
+                break
+        return rv, r2
+
+    @staticmethod
+    def _strip(region, endings):
+        """Удаляет самое длинное из окончаний, которым заканчивается region."""
+        for ending in sorted(endings, key=len, reverse=True):
+            if region.endswith(ending):
+                return region[:-len(ending)]
+        return None
+
+    @staticmethod
+    def _strip_grouped(region, groups):
+        """Выбирает самое длинное окончание из обеих групп. Окончание первой группы удаляется,
+        только если перед ним «а» или «я»; иначе шаг не выполняется, более короткие окончания не проверяются."""
+        first, second = groups
+        matches = [ending for ending in first + second if region.endswith(ending)]
+        if not matches:
+            return None
+        ending = max(matches, key=len)
+        stem = region[:-len(ending)]
+        if ending in first and not stem.endswith(('а', 'я')):
+            return None
+        return stem
+
+    def stem(self, word):
+        word = word.replace('ё', 'е')
+        rv, r2 = self._regions(word)
+        prefix, region = word[:rv], word[rv:]
+
+        # Шаг 1: деепричастия, иначе возвратные частицы и затем прилагательные, глаголы или существительные
+        stem = self._strip_grouped(region, self.PERFECTIVE_GERUND)
+        if stem is not None:
+            region = stem
+        else:
+            stem = self._strip(region, self.REFLEXIVE)
+            if stem is not None:
+                region = stem
+            stem = self._strip(region, self.ADJECTIVE)
+            if stem is not None:
+                participle = self._strip_grouped(stem, self.PARTICIPLE)
+                region = participle if participle is not None else stem
+            else:
+                stem = self._strip_grouped(region, self.VERB)
+                if stem is None:
+                    stem = self._strip(region, self.NOUN)
+                if stem is not None:
+                    region = stem
+
+        # Шаг 2
+        if region.endswith('и'):
+            region = region[:-1]
+
+        # Шаг 3: словообразовательные суффиксы в R2
+        r2_offset = max(r2 - rv, 0)
+        if region[r2_offset:].endswith(self.DERIVATIONAL):
+            region = self._strip(region, self.DERIVATIONAL)
+
+        # Шаг 4
+        if region.endswith('нн'):
+            region = region[:-1]
+        else:
+            stem = self._strip(region, self.SUPERLATIVE)
+            if stem is not None:
+                region = stem[:-1] if stem.endswith('нн') else stem
+            elif region.endswith('ь'):
+                region = region[:-1]
+        return prefix + region
+
+
+_stemmer = RussianStemmer()
+
+
+@lru_cache(maxsize=100000)
+def _stem(word):
+    return _stemmer.stem(word)
+
+
+def tokenize(text):
+    return [_stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+# Разбиение материала на фрагменты по пустым строкам
+def split_passages(text):
+    return [passage.strip() for passage in re.split(r'\n\s*\n', text) if passage.strip()]
+
+
+# Неизменяемый индекс BM25: для каждого термина - список фрагментов и готовые веса
+class _Index:
+    def __init__(self, vocabulary, passages, term_ptr, doc_ids, weights):
+        self.vocabulary = vocabulary
+        self.passages = passages
+        self.term_ptr = term_ptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+
+    @classmethod
+    def build(cls, documents):
+        """documents - список (passage, source, {термин: частота})."""
+        vocabulary = {}
+        term_ids, doc_ids, tfs = [], [], []
+        lengths = np.zeros(len(documents), dtype=np.float32)
+        for doc_id, (_, _, counts) in enumerate(documents):
+            for term, tf in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            lengths[doc_id] = sum(counts.values())
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        tfs = np.asarray(tfs, dtype=np.float32)
+        order = np.argsort(term_ids, kind='stable')
+        term_ids, doc_ids, tfs = term_ids[order], doc_ids[order], tfs[order]
+
+        df = np.bincount(term_ids, minlength=len(vocabulary))
+        term_ptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df, out=term_ptr[1:])
+
+        n_docs = max(len(documents), 1)
+        avg_length = float(lengths.mean()) if lengths.any() else 1.0
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / avg_length)
+        weights = (idf[term_ids] * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32)
+
+        passages = [(passage, source) for passage, source, _ in documents]
+        return cls(vocabulary, passages, term_ptr, doc_ids, weights)
+
+    def search(self, terms, k):
+        scores = np.zeros(len(self.passages), dtype=np.float32)
+        for term in set(terms):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.term_ptr[term_id], self.term_ptr[term_id + 1]
+            # Внутри одного термина фрагменты не повторяются, поэтому np.add.at не нужен
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        top = matched[np.argsort(-scores[matched], kind='stable')[:k]]
+        return [(self.passages[i][0], self.passages[i][1], float(scores[i])) for i in top]
+
+
+# Поиск по учебным материалам без сети.
+# Индекс хранится в index_dir и открывается через memory map; при изменении файлов
+# в materials_dir заново разбираются только изменившиеся файлы.
+# Если индекс используют несколько процессов, строит его только один (writer=True),
+# остальные перечитывают индекс с диска, когда он меняется.
+class SearchEngine:
+    EXTENSIONS = ('.txt', '.md')
+
+    def __init__(self, materials_dir, index_dir, cache_size=1024, writer=True):
+        self.materials_dir = materials_dir
+        self.index_dir = index_dir
+        self.writer = writer
+        self._files = {}
+        self._generation = 0
+        self._meta_mtime = None
+        self._index = _Index.build([])
+        self._lock = threading.Lock()
+        self._cached_search = lru_cache(maxsize=cache_size)(self._search)
+        self._load()
+        if writer:
+            self.refresh()
+
+    def _list_materials(self):
+        files = {}
+        for path in glob.glob(os.path.join(self.materials_dir, '**', '*'), recursive=True):
+            if path.endswith(self.EXTENSIONS) and os.path.isfile(path):
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.materials_dir)] = [stat.st_mtime, stat.st_size]
+        return files
+
+    def _load(self):
+        meta_path = os.path.join(self.index_dir, 'meta.json')
+        if not os.path.exists(meta_path):
+            return
+        try:
+            meta_mtime = os.stat(meta_path).st_mtime_ns
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('format') != INDEX_FORMAT:
+                raise ValueError(f"Устаревший формат индекса: {meta.get('format')}")
+            generation = meta['generation']
+            arrays = {
+                name: np.load(os.path.join(self.index_dir, f'{name}.{generation}.npy'), mmap_mode='r')
+                for name in ('term_ptr', 'doc_ids', 'weights')
+            }
+            # Частоты терминов по фрагментам нужны только для перестроения индекса
+            if self.writer:
+                with open(os.path.join(self.index_dir, f'terms.{generation}.json'), 'r', encoding='utf-8') as f:
+                    terms = json.load(f)
+                files = {
+                    path: {'stat': info['stat'], 'passages': [
+                        {'text': text, 'terms': counts} for text, counts in zip(info['passages'], terms[path])
+                    ]}
+                    for path, info in meta['files'].items()
+                }
+        except (OSError, ValueError, KeyError):
+            logger.exception("Не удалось загрузить поисковый индекс из %s, он будет построен заново", self.index_dir)
+            return
+        if self.writer:
+            self._files = files
+        passages = [(text, path) for path, info in meta['files'].items() for text in info['passages']]
+        self._index = _Index(meta['vocabulary'], passages, arrays['term_ptr'], arrays['doc_ids'], arrays['weights'])
+        self._generation = generation
+        self._meta_mtime = meta_mtime
+
+    def _save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        generation = self._generation + 1
+        for name in ('term_ptr', 'doc_ids', 'weights'):
+            np.save(os.path.join(self.index_dir, f'{name}.{generation}.npy'), getattr(self._index, name))
+        terms = {path: [passage['terms'] for passage in info['passages']] for path, info in self._files.items()}
+        with open(os.path.join(self.index_dir, f'terms.{generation}.json'), 'w', encoding='utf-8') as f:
+            json.dump(terms, f, ensure_ascii=False)
+        # В meta.json только то, что нужно для поиска: его читает каждый процесс
+        files = {
+            path: {'stat': info['stat'], 'passages': [passage['text'] for passage in info['passages']]}
+            for path, info in self._files.items()
+        }
+        meta = {'format': INDEX_FORMAT, 'generation': generation, 'vocabulary': self._index.vocabulary, 'files': files}
+        tmp_path = os.path.join(self.index_dir, 'meta.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.index_dir, 'meta.json'))
+
+        # Файлы предыдущего поколения больше не нужны
+        for path in glob.glob(os.path.join(self.index_dir, '*.npy')) + glob.glob(os.path.join(self.index_dir, 'terms.*.json')):
+            if not path.endswith((f'.{generation}.npy', f'.{generation}.json')):
+                os.remove(path)
+        self._generation = generation
+
+    def refresh(self):
+        """Перестраивает индекс, если материалы изменились. Возвращает True, если индекс обновлён."""
+        if not self.writer:
+            return self._reload()
+        with self._lock:
+            current = self._list_materials()
+            if {path: info['stat'] for path, info in self._files.items()} == current:
+                return False
+
+            files = {}
+            for path, stat in current.items():
+                cached = self._files.get(path)
+                if cached and cached['stat'] == stat:
+                    files[path] = cached
+                    continue
+                with open(os.path.join(self.materials_dir, path), 'r', encoding='utf-8') as f:
+                    passages = split_passages(f.read())
+                files[path] = {'stat': stat, 'passages': [
+                    {'text': passage, 'terms': self._count_terms(passage)} for passage in passages
+                ]}
+
+            documents = [
+                (passage['text'], path, passage['terms'])
+                for path, info in files.items() for passage in info['passages']
+            ]
+            self._files = files
+            self._index = _Index.build(documents)
+            self._cached_search.cache_clear()
+            self._save()
+            logger.info("Поисковый индекс обновлён: %d файлов, %d фрагментов", len(files), len(documents))
+            return True
+
+    # Перечитывание индекса, построенного другим процессом
+    def _reload(self):
+        try:
+            mtime = os.stat(os.path.join(self.index_dir, 'meta.json')).st_mtime_ns
+        except OSError:
+            return False
+        with self._lock:
+            if mtime == self._meta_mtime:
+                return False
+            generation = self._generation
+            self._load()
+            if self._generation == generation:
+                return False
+            self._cached_search.cache_clear()
+            logger.info("Поисковый индекс перечитан с диска, поколение %d", self._generation)
+            return True
+
+    @staticmethod
+    def _count_terms(text):
+        counts = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        return counts
+
+    def _search(self, terms, k):
+        return self._index.search(terms, k)
+
+    def search(self, query, k=3):
+        """Возвращает до k фрагментов (текст, файл, оценка), наиболее подходящих к вопросу."""
+        terms = tuple(sorted(set(tokenize(query))))
+        if not terms:
+            return []
+        return self._cached_search(terms, k)
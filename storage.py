@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from urllib.request import pathname2url
+from directory import group_key, faculty_key
+
+logger = logging.getLogger(__name__)
+
+
+# Нормализованные группа и факультет записи для поиска получателей рассылок
+def _directory_keys(data):
+    group = group_key(data['group']) if data.get('group') else None
+    faculty = faculty_key(data['faculty']) if data.get('faculty') else None
+    return group, faculty
+
+
+# Базовый интерфейс хранилища данных пользователей
+class StorageBackend:
+    # Объём записанных данных и число записей, для нагрузочных тестов и метрик
+    bytes_written = 0
+    writes = 0
+    fsyncs = 0
+
+    def get(self, user_id):
+        """Возвращает запись пользователя или None, если её нет."""
+        raise NotImplementedError
+
+    def put(self, user_id, data):
+        """Сохраняет одну запись пользователя."""
+        raise NotImplementedError
+
+    def find_users(self, group=None, faculty=None):
+        """Возвращает id пользователей указанной группы или факультета (без фильтра — всех)."""
+        raise NotImplementedError
+
+    def iter_records(self, since=None, group=None, chunk_size=500):
+        """Последовательно отдаёт записи (user_id, data, updated_at), изменённые после since, при group - только этой группы."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+# Хранилище в одном JSON-файле (прежний формат).
+# Файл перезаписывается целиком, но атомарно: сначала во временный файл, затем os.replace.
+class JsonFileStorage(StorageBackend):
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._data = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                self._data = json.load(f)
+
+    def get(self, user_id):
+        with self._lock:
+            return self._data.get(str(user_id))
+
+    def put(self, user_id, data):
+        with self._lock:
+            self._data[str(user_id)] = data
+            tmp_path = self.file_path + '.tmp'
+            payload = json.dumps(self._data, ensure_ascii=False, indent=4).encode('utf-8')
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.file_path)
+            self.bytes_written += len(payload)
+            self.writes += 1
+            self.fsyncs += 1
+
+    # Индексов в JSON-файле нет, поэтому поиск перебирает все записи
+    def find_users(self, group=None, faculty=None):
+        group = group_key(group) if group else None
+        faculty = faculty_key(faculty) if faculty else None
+        with self._lock:
+            items = list(self._data.items())
+        result = []
+        for user_id, data in items:
+            data_group, data_faculty = _directory_keys(data)
+            if (group is None or data_group == group) and (faculty is None or data_faculty == faculty):
+                result.append(int(user_id))
+        return result
+
+    # Время изменения отдельных записей в JSON-файле не хранится, поэтому since не поддерживается
+    def iter_records(self, since=None, group=None, chunk_size=500):
+        if since is not None:
+            raise ValueError("JSON-хранилище не поддерживает выгрузку только изменённых записей")
+        group = group_key(group) if group else None
+        with self._lock:
+            items = list(self._data.items())
+        for user_id, data in items:
+            if group is None or _directory_keys(data)[0] == group:
+                yield int(user_id), data, None
+
+
+# Хранилище SQLite в режиме WAL: каждая запись пишет только изменённую строку.
+# Автоматический checkpoint отключён, журнал сжимается фоновым потоком.
+# С read_only=True открывается существующая база только для чтения: без создания таблиц,
+# миграций и checkpoint, например для выгрузки рядом с работающим ботом.
+class SQLiteStorage(StorageBackend):
+    def __init__(self, db_path, legacy_json_path=None, checkpoint_interval=30, read_only=False):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        if read_only:
+            uri = 'file:' + pathname2url(os.path.abspath(db_path)) + '?mode=ro'
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+            self._checkpoint_thread = None
+            return
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA wal_autocheckpoint=0')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS users ('
+            'user_id INTEGER PRIMARY KEY, '
+            'data TEXT NOT NULL, '
+            'updated_at REAL NOT NULL, '
+            'group_key TEXT, '
+            'faculty_key TEXT)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS users_updated_at ON users (updated_at, user_id)')
+        self._add_directory_columns()
+        if legacy_json_path:
+            self._migrate_json(legacy_json_path)
+
+        self._stop_event = threading.Event()
+        self._checkpoint_thread = threading.Thread(
+            target=self._checkpoint_loop, args=(checkpoint_interval,), name='sqlite-checkpoint', daemon=True
+        )
+        self._checkpoint_thread.start()
+
+    # Миграция в транзакции BEGIN IMMEDIATE: базу могут одновременно открыть несколько процессов,
+    # поэтому условие миграции проверяется заново уже под блокировкой записи.
+    # Возвращает False, если миграцию успел выполнить другой процесс.
+    def _migrate(self, needed, apply):
+        if not needed():
+            return False
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            if not needed():
+                self._conn.execute('ROLLBACK')
+                return False
+            apply()
+            self._conn.execute('COMMIT')
+        except BaseException:
+            if self._conn.in_transaction:
+                self._conn.execute('ROLLBACK')
+            raise
+        return True
+
+    # Столбцы с нормализованными группой и факультетом и индексы по ним.
+    # В базе, созданной до их появления, столбцы добавляются и заполняются один раз.
+    def _add_directory_columns(self):
+        def needed():
+            return 'group_key' not in {row[1] for row in self._conn.execute('PRAGMA table_info(users)')}
+
+        def apply():
+            self._conn.execute('ALTER TABLE users ADD COLUMN group_key TEXT')
+            self._conn.execute('ALTER TABLE users ADD COLUMN faculty_key TEXT')
+            rows = self._conn.execute('SELECT user_id, data FROM users').fetchall()
+            self._conn.executemany(
+                'UPDATE users SET group_key = ?, faculty_key = ? WHERE user_id = ?',
+                (_directory_keys(json.loads(data)) + (user_id,) for user_id, data in rows)
+            )
+
+        self._migrate(needed, apply)
+        # Индекс по группе подходит и для выбора получателей, и для постраничной выгрузки группы
+        self._conn.execute('DROP INDEX IF EXISTS users_group_key')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS users_group_updated ON users (group_key, updated_at, user_id)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS users_faculty_key ON users (faculty_key)')
+
+    # Перенос данных из user_data.json при первом запуске
+    def _migrate_json(self, json_path):
+        legacy_data = {}
+
+        def needed():
+            return os.path.exists(json_path) and not self._conn.execute('SELECT 1 FROM users LIMIT 1').fetchone()
+
+        def apply():
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    legacy_data.update(json.load(f))
+            except FileNotFoundError:
+                # Пустой файл уже перенёс другой процесс
+                return
+            now = time.time()
+            self._conn.executemany(
+                'INSERT INTO users (user_id, data, updated_at, group_key, faculty_key) VALUES (?, ?, ?, ?, ?)',
+                ((int(user_id), json.dumps(data, ensure_ascii=False), now) + _directory_keys(data)
+                 for user_id, data in legacy_data.items())
+            )
+
+        with self._lock:
+            if not self._migrate(needed, apply):
+                return
+        # Файл переименовывается только после COMMIT, иначе при сбое записи данные остались бы только в .migrated.
+        # Если процесс упадёт до переименования, перенос не повторится: таблица уже не пуста.
+        try:
+            os.replace(json_path, json_path + '.migrated')
+        except FileNotFoundError:
+            return
+        logger.info("Перенесено %d записей из %s в %s", len(legacy_data), json_path, self.db_path)
+
+    def _checkpoint_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            self.checkpoint()
+
+    # Перенос WAL-журнала в основной файл базы и его усечение.
+    # При synchronous=NORMAL синхронизация с диском происходит только здесь.
+    def checkpoint(self):
+        try:
+            with self._lock:
+                self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                self.fsyncs += 1
+        except sqlite3.Error:
+            logger.exception("Не удалось выполнить checkpoint для %s", self.db_path)
+
+    def get(self, user_id):
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM users WHERE user_id = ?', (int(user_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, user_id, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        group, faculty = _directory_keys(data)
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO users (user_id, data, updated_at, group_key, faculty_key) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, '
+                'group_key = excluded.group_key, faculty_key = excluded.faculty_key',
+                (int(user_id), payload, time.time(), group, faculty)
+            )
+            self.bytes_written += len(payload.encode('utf-8'))
+            self.writes += 1
+
+    def find_users(self, group=None, faculty=None):
+        conditions, params = [], []
+        if group:
+            conditions.append('group_key = ?')
+            params.append(group_key(group))
+        if faculty:
+            conditions.append('faculty_key = ?')
+            params.append(faculty_key(faculty))
+        query = 'SELECT user_id FROM users'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self._lock:
+            return [user_id for user_id, in self._conn.execute(query, params)]
+
+    # Чтение порциями по chunk_size строк, без загрузки всей таблицы в память
+    def iter_records(self, since=None, group=None, chunk_size=500):
+        # Постраничный обход по ключу (updated_at, user_id); записи с updated_at == since уже выгружены
+        last_key = (since, 2 ** 63 - 1) if since is not None else (0.0, -1)
+        group_filter, group_params = ('group_key = ? AND ', (group_key(group),)) if group else ('', ())
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT user_id, data, updated_at FROM users '
+                    f'WHERE {group_filter}(updated_at, user_id) > (?, ?) ORDER BY updated_at, user_id LIMIT ?',
+                    group_params + (last_key[0], last_key[1], chunk_size)
+                ).fetchall()
+            if not rows:
+                return
+            for user_id, data, updated_at in rows:
+                yield user_id, json.loads(data), updated_at
+            last_key = (rows[-1][2], rows[-1][0])
+
+    def close(self):
+        if self._checkpoint_thread is not None:
+            self._stop_event.set()
+            self._checkpoint_thread.join()
+            self.checkpoint()
+        with self._lock:
+            self._conn.close()
+
+
+# Создание хранилища по имени движка
+def create_storage(backend, json_path, db_path):
+    if backend == 'json':
+        return JsonFileStorage(json_path)
+    if backend == 'sqlite':
+        return SQLiteStorage(db_path, legacy_json_path=json_path)
+    raise ValueError(f"Неизвестный тип хранилища: {backend}")
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+import pytest
+from telegram.ext import DispatcherHandlerStop
+import metrics
+from admission import AdmissionControl
+
+ADMIN_ID = 1
+
+
+def dropped(reason):
+    return metrics.ADMISSION_DROPPED._values.get((reason,), 0)
+
+
+class FakeQuery:
+    def __init__(self, data, message_id=7):
+        self.data = data
+        self.message = SimpleNamespace(chat_id=10, message_id=message_id)
+        self.answered = 0
+
+    def answer(self):
+        self.answered += 1
+
+
+def make_update(update_id, user_id=10, callback_query=None):
+    return SimpleNamespace(
+        update_id=update_id,
+        effective_user=SimpleNamespace(id=user_id),
+        effective_chat=SimpleNamespace(id=user_id),
+        callback_query=callback_query,
+    )
+
+
+@pytest.fixture
+def context():
+    sent = []
+    bot = SimpleNamespace(send_message=lambda **kwargs: sent.append(kwargs))
+    return SimpleNamespace(bot=bot, sent=sent)
+
+
+def make_admission(**kwargs):
+    kwargs.setdefault('backlog', lambda: 0)
+    kwargs.setdefault('global_rate', 1000)
+    return AdmissionControl(exempt_ids=[ADMIN_ID], **kwargs)
+
+
+def test_duplicate_update_is_dropped(context):
+    admission = make_admission()
+    before = dropped('duplicate')
+    admission.admit(make_update(1), context)
+    with pytest.raises(DispatcherHandlerStop):
+        admission.admit(make_update(1), context)
+    assert dropped('duplicate') == before + 1
+
+
+def test_repeated_press_is_answered_and_dropped(context):
+    admission = make_admission()
+    admission.admit(make_update(1, callback_query=FakeQuery('lab1')), context)
+
+    query = FakeQuery('lab1')
+    with pytest.raises(DispatcherHandlerStop):
+        admission.admit(make_update(2, callback_query=query), context)
+    assert query.answered == 1
+
+    # Другая кнопка того же сообщения - не повтор
+    admission.admit(make_update(3, callback_query=FakeQuery('lab2')), context)
+
+
+def test_user_rate_drops_and_warns_once(context):
+    admission = make_admission(user_rate=0.001, user_burst=2)
+    admission.admit(make_update(1), context)
+    admission.admit(make_update(2), context)
+    for update_id in (3, 4):
+        with pytest.raises(DispatcherHandlerStop):
+            admission.admit(make_update(update_id), context)
+    assert len(context.sent) == 1
+
+    # Ограничение у каждого пользователя своё
+    admission.admit(make_update(5, user_id=11), context)
+
+
+def test_user_rate_answers_dropped_press(context):
+    admission = make_admission(user_rate=0.001, user_burst=1)
+    admission.admit(make_update(1), context)
+    query = FakeQuery('lab1')
+    with pytest.raises(DispatcherHandlerStop):
+        admission.admit(make_update(2, callback_query=query), context)
+    assert query.answered == 1
+    assert context.sent == []
+
+
+def test_overload_drops_but_admins_pass(context):
+    admission = make_admission(backlog=lambda: 5000, max_backlog=1000)
+    with pytest.raises(DispatcherHandlerStop):
+        admission.admit(make_update(1), context)
+    admission.admit(make_update(2, user_id=ADMIN_ID), context)
+
+
+def test_dropped_update_is_not_a_handler_error():
+    def admit(update, context):
+        raise DispatcherHandlerStop()
+
+    wrapped = metrics.timed_callback(admit, 'NONE')
+    before = metrics.HANDLER_ERRORS._values.get(('admit', 'NONE'), 0)
+    with pytest.raises(DispatcherHandlerStop):
+        wrapped(None, None)
+    assert metrics.HANDLER_ERRORS._values.get(('admit', 'NONE'), 0) == before
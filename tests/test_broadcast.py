@@ -0,0 +1,87 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from telegram.error import RetryAfter, Unauthorized
+from broadcast import BroadcastStore, BroadcastManager, PENDING, SENT, BLOCKED
+
+
+# Бот, который запоминает отправленные сообщения; errors[chat_id] - исключения для первых попыток
+class FakeBot:
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self._lock:
+            errors = self.errors.get(chat_id)
+            if errors:
+                raise errors.pop(0)
+            self.sent.append(chat_id)
+        return SimpleNamespace(message_id=len(self.sent))
+
+    def edit_message_text(self, **kwargs):
+        pass
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BroadcastStore(str(tmp_path / 'broadcast.db'))
+    yield store
+    store.close()
+
+
+def run_jobs(manager):
+    for thread in manager._threads:
+        thread.join(10)
+
+
+def test_blocked_users_are_skipped_until_unblocked(store):
+    job_id = store.create_job(100, 'первая', None, [1, 2, 3])
+    store.set_status(job_id, 2, BLOCKED, 1)
+
+    job_id = store.create_job(100, 'вторая', None, [1, 2, 3])
+    assert sorted(store.pending_recipients(job_id)) == [1, 3]
+
+    store.unblock(2)
+    job_id = store.create_job(100, 'третья', None, [1, 2, 3])
+    assert sorted(store.pending_recipients(job_id)) == [1, 2, 3]
+
+
+def test_duplicate_recipients_are_stored_once(store):
+    job_id = store.create_job(100, 'текст', None, [1, 1, 2])
+    assert store.counts(job_id)[PENDING] == 2
+
+
+def test_unfinished_job_resumes_with_pending_recipients(store):
+    job_id = store.create_job(100, 'текст', None, [1, 2, 3])
+    store.set_status(job_id, 1, SENT, 1)
+
+    bot = FakeBot()
+    manager = BroadcastManager(store, rate=1000, workers=2)
+    manager.start(bot, resume=True)
+    run_jobs(manager)
+
+    assert sorted(bot.sent) == [2, 3, 100]
+    assert store.counts(job_id)[SENT] == 3
+    assert store.unfinished_jobs() == []
+
+
+def test_resume_is_left_to_one_process(store):
+    store.create_job(100, 'текст', None, [1])
+    manager = BroadcastManager(store, rate=1000)
+    manager.start(FakeBot(), resume=False)
+    assert manager._threads == []
+
+
+def test_retry_after_is_not_counted_as_attempt(store):
+    bot = FakeBot({1: [RetryAfter(0) for _ in range(4)], 2: [Unauthorized('blocked')]})
+    manager = BroadcastManager(store, rate=1000, max_attempts=2)
+    manager.start(bot, resume=False)
+    job_id = manager.submit(100, 'текст', None, [1, 2])
+    run_jobs(manager)
+
+    counts = store.counts(job_id)
+    assert counts[SENT] == 1
+    assert counts[BLOCKED] == 1
+    assert 1 in bot.sent
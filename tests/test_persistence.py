@@ -0,0 +1,61 @@
+import sqlite3
+import pytest
+from persistence import SQLitePersistence
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / 'bot_state.db')
+
+
+@pytest.fixture
+def persistence(db_path):
+    # Фоновый сброс не мешает тесту: пачки записываются только явным вызовом
+    persistence = SQLitePersistence(db_path, flush_interval=3600)
+    yield persistence
+    persistence.flush()
+
+
+def test_state_survives_restart(db_path, persistence):
+    persistence.update_conversation('lab1', (10, 10), 3)
+    persistence.update_user_data(10, {'step': 1})
+    persistence.flush()
+
+    restored = SQLitePersistence(db_path, flush_interval=3600)
+    try:
+        assert restored.get_conversations('lab1') == {(10, 10): 3}
+        assert restored.get_user_data()[10] == {'step': 1}
+    finally:
+        restored.flush()
+
+
+def test_ended_conversation_is_deleted(db_path, persistence):
+    persistence.update_conversation('lab1', (10, 10), 3)
+    persistence._flush_dirty()
+    persistence.update_conversation('lab1', (10, 10), None)
+    persistence._flush_dirty()
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM conversations').fetchone() == (0,)
+
+
+def test_failed_flush_keeps_entries_dirty(db_path, persistence):
+    persistence.update_conversation('lab1', (10, 10), 3)
+    persistence.update_user_data(10, {'step': 1})
+    persistence._conn.execute('PRAGMA busy_timeout = 0')
+
+    # Другое соединение держит блокировку записи, BEGIN IMMEDIATE не проходит
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    with pytest.raises(sqlite3.OperationalError):
+        persistence._flush_dirty()
+    assert not persistence._conn.in_transaction
+    assert persistence._dirty_conversations == {('lab1', (10, 10))}
+    assert persistence._dirty_users == {10}
+    blocker.execute('ROLLBACK')
+    blocker.close()
+
+    persistence._flush_dirty()
+    assert not persistence._dirty_conversations and not persistence._dirty_users
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT state FROM conversations').fetchone() == ('3',)
+        assert conn.execute('SELECT data FROM user_data WHERE user_id = 10').fetchone() == ('{"step": 1}',)
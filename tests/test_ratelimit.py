@@ -0,0 +1,61 @@
+import pytest
+import ratelimit
+from ratelimit import TokenBucket
+
+
+# Часы, которые двигает только тест: time.sleep сдвигает их без реального ожидания
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(ratelimit.time, 'sleep', clock.sleep)
+    return clock
+
+
+def test_try_acquire_returns_wait_when_empty(clock):
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(0.1)
+    clock.sleep(0.1)
+    assert bucket.try_acquire() == 0
+
+
+def test_pause_blocks_and_does_not_refill(clock):
+    bucket = TokenBucket(rate=10, capacity=10)
+    bucket.pause(5)
+    assert bucket.try_acquire() == pytest.approx(5)
+
+    # После паузы нет накопленного за неё запаса токенов
+    clock.sleep(5)
+    assert bucket.try_acquire() == pytest.approx(0.1)
+    clock.sleep(0.1)
+    assert bucket.try_acquire() == 0
+
+
+def test_pause_keeps_the_longest_deadline(clock):
+    bucket = TokenBucket(rate=10)
+    bucket.pause(5)
+    bucket.pause(1)
+    assert bucket.try_acquire() == pytest.approx(5)
+
+
+def test_acquire_with_timeout(clock):
+    bucket = TokenBucket(rate=1, capacity=1)
+    assert bucket.acquire(timeout=0)
+    started = clock.now
+    assert not bucket.acquire(timeout=0.5)
+    assert clock.now == started
+    assert bucket.acquire(timeout=1)
+    assert clock.now == pytest.approx(started + 1)
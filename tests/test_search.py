@@ -0,0 +1,75 @@
+import os
+import json
+import pytest
+from search import RussianStemmer, SearchEngine
+
+# Ожидаемые основы взяты из эталонной реализации Snowball для русского языка
+SNOWBALL_STEMS = [
+    ('важнейшие', 'важн'),
+    ('ванной', 'ван'),
+    ('валялась', 'валя'),
+    ('книгами', 'книг'),
+    ('экологической', 'экологическ'),
+    ('переработка', 'переработк'),
+    ('загрязнение', 'загрязнен'),
+    ('устойчивости', 'устойчив'),
+    ('прочитавшись', 'прочита'),
+    ('сохранившийся', 'сохран'),
+    ('говорить', 'говор'),
+    ('общежитие', 'общежит'),
+    ('отходов', 'отход'),
+    ('ёлки', 'елк'),
+    ('бегающий', 'бега'),
+]
+
+
+@pytest.mark.parametrize('word, stem', SNOWBALL_STEMS)
+def test_stem_matches_snowball(word, stem):
+    assert RussianStemmer().stem(word) == stem
+
+
+@pytest.fixture
+def materials(tmp_path):
+    materials_dir = tmp_path / 'materials'
+    materials_dir.mkdir()
+    (materials_dir / 'ecology.txt').write_text(
+        'Переработка отходов снижает загрязнение почвы.\n\n'
+        'Общежитие открыто для студентов круглосуточно.',
+        encoding='utf-8'
+    )
+    return str(materials_dir), str(tmp_path / 'index')
+
+
+def test_search_finds_passage_by_word_form(materials):
+    engine = SearchEngine(*materials)
+    results = engine.search('переработке отхода')
+    assert results
+    text, source, _ = results[0]
+    assert text.startswith('Переработка отходов')
+    assert source == 'ecology.txt'
+
+
+def test_term_counts_are_kept_out_of_meta(materials):
+    materials_dir, index_dir = materials
+    SearchEngine(materials_dir, index_dir)
+    with open(os.path.join(index_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    assert all(isinstance(text, str) for info in meta['files'].values() for text in info['passages'])
+    assert os.path.exists(os.path.join(index_dir, f"terms.{meta['generation']}.json"))
+
+    reader = SearchEngine(materials_dir, index_dir, writer=False)
+    assert reader.search('общежитие')[0][0].startswith('Общежитие')
+
+
+def test_writer_reuses_index_and_rebuilds_changed_files(materials):
+    materials_dir, index_dir = materials
+    SearchEngine(materials_dir, index_dir)
+    writer = SearchEngine(materials_dir, index_dir)
+    assert not writer.refresh()
+
+    path = os.path.join(materials_dir, 'ecology.txt')
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('\n\nСортировка мусора начинается дома.')
+    os.utime(path, (0, 0))
+    assert writer.refresh()
+    assert writer.search('сортировку мусора')
@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import multiprocessing
+import pytest
+from storage import SQLiteStorage, JsonFileStorage
+
+LEGACY_USERS = {
+    '1': {'name': 'Иванов Иван Иванович', 'faculty': 'Экология', 'group': 'g4150'},
+    '2': {'name': 'Петров Пётр Петрович', 'faculty': 'Экология', 'group': 'G4151'},
+}
+
+
+@pytest.fixture
+def legacy_json(tmp_path):
+    path = tmp_path / 'user_data.json'
+    path.write_text(json.dumps(LEGACY_USERS, ensure_ascii=False), encoding='utf-8')
+    return path
+
+
+def test_json_records_are_migrated_once(tmp_path, legacy_json):
+    db_path = str(tmp_path / 'user_data.db')
+    storage = SQLiteStorage(db_path, legacy_json_path=str(legacy_json))
+    try:
+        assert storage.get(1) == LEGACY_USERS['1']
+        assert sorted(storage.find_users(group='G4150')) == [1]
+        assert sorted(storage.find_users(faculty='экология')) == [1, 2]
+    finally:
+        storage.close()
+    assert not legacy_json.exists()
+    assert (tmp_path / 'user_data.json.migrated').exists()
+
+    # Новый user_data.json при непустой базе не переносится
+    legacy_json.write_text(json.dumps({'3': {'name': 'X'}}), encoding='utf-8')
+    storage = SQLiteStorage(db_path, legacy_json_path=str(legacy_json))
+    try:
+        assert storage.get(3) is None
+    finally:
+        storage.close()
+
+
+def test_failed_migration_is_rolled_back(tmp_path, legacy_json):
+    # Группа-число ломает нормализацию на последней записи, когда часть строк уже вставлена
+    broken = dict(LEGACY_USERS, **{'3': {'name': 'Сидоров', 'group': 4152}})
+    legacy_json.write_text(json.dumps(broken, ensure_ascii=False), encoding='utf-8')
+    db_path = str(tmp_path / 'user_data.db')
+    with pytest.raises(AttributeError):
+        SQLiteStorage(db_path, legacy_json_path=str(legacy_json))
+    assert legacy_json.exists()
+    storage = SQLiteStorage(db_path, read_only=True)
+    try:
+        assert storage.find_users() == []
+    finally:
+        storage.close()
+
+    legacy_json.write_text(json.dumps(LEGACY_USERS, ensure_ascii=False), encoding='utf-8')
+    storage = SQLiteStorage(db_path, legacy_json_path=str(legacy_json))
+    try:
+        assert sorted(storage.find_users()) == [1, 2]
+    finally:
+        storage.close()
+
+
+def test_put_updates_directory_keys(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / 'user_data.db'))
+    try:
+        storage.put(1, {'group': 'g1'})
+        storage.put(1, {'group': 'g2'})
+        assert storage.find_users(group='G1') == []
+        assert storage.find_users(group='G2') == [1]
+        assert [user_id for user_id, _, _ in storage.iter_records(group='g2', chunk_size=1)] == [1]
+    finally:
+        storage.close()
+
+
+def test_json_storage_roundtrip(tmp_path):
+    path = str(tmp_path / 'user_data.json')
+    JsonFileStorage(path).put(5, {'group': 'G1'})
+    storage = JsonFileStorage(path)
+    assert storage.get(5) == {'group': 'G1'}
+    assert storage.find_users(group='g1') == [5]
+
+
+def _open_storage(db_path, json_path, barrier):
+    barrier.wait()
+    SQLiteStorage(db_path, legacy_json_path=json_path).close()
+
+
+@pytest.mark.parametrize('legacy_schema', [False, True])
+def test_concurrent_opens_migrate_once(tmp_path, legacy_json, legacy_schema):
+    db_path = str(tmp_path / 'user_data.db')
+    if legacy_schema:
+        # База до появления столбцов group_key и faculty_key
+        with sqlite3.connect(db_path) as conn:
+            conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)')
+            conn.executemany('INSERT INTO users VALUES (?, ?, 0)', [(int(k), json.dumps(v)) for k, v in LEGACY_USERS.items()])
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(4)
+    processes = [context.Process(target=_open_storage, args=(db_path, str(legacy_json), barrier)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+    assert [process.exitcode for process in processes] == [0] * 4
+
+    storage = SQLiteStorage(db_path, read_only=True)
+    try:
+        assert sorted(storage.find_users(group='G4150') + storage.find_users(group='G4151')) == [1, 2]
+    finally:
+        storage.close()
@@ -0,0 +1,56 @@
+import json
+import logging
+from types import SimpleNamespace
+import pytest
+import config
+import webhook
+from webhook import WebhookRouter, update_user_id
+
+
+@pytest.mark.parametrize('update, user_id', [
+    ({'update_id': 1, 'message': {'from': {'id': 42}, 'chat': {'id': -100}}}, 42),
+    ({'update_id': 1, 'callback_query': {'from': {'id': 43}, 'data': 'lab1'}}, 43),
+    ({'update_id': 1, 'my_chat_member': {'from': {'id': 44}, 'chat': {'id': 44}}}, 44),
+    ({'update_id': 1, 'channel_post': {'chat': {'id': -200}}}, -200),
+    ({'update_id': 1}, 0),
+])
+def test_update_user_id(update, user_id):
+    assert update_user_id(update) == user_id
+
+
+@pytest.fixture
+def router():
+    router = WebhookRouter(3, port=0)
+    # Процессы-обработчики не запускаются, вместо них заглушки с нужным состоянием
+    router.processes = [SimpleNamespace(name=f'shard-{i}', is_alive=lambda: True, exitcode=None) for i in range(3)]
+    yield router
+    router.server.server_close()
+
+
+def message_from(user_id):
+    return json.dumps({'update_id': user_id, 'message': {'from': {'id': user_id}, 'chat': {'id': user_id}}})
+
+
+def test_updates_of_one_user_go_to_one_shard(router):
+    for user_id in (3, 4, 5, 6):
+        assert router.route(message_from(user_id))
+    assert [router.queues[shard].get(timeout=5) for shard in (0, 0)] == [message_from(3), message_from(6)]
+    assert router.queues[1].get(timeout=5) == message_from(4)
+    assert router.queues[2].get(timeout=5) == message_from(5)
+
+
+def test_dead_shard_is_reported(router, caplog):
+    router.processes[1] = SimpleNamespace(name='shard-1', is_alive=lambda: False, exitcode=1)
+    with caplog.at_level(logging.ERROR, logger='webhook'):
+        assert not router.route(message_from(4))
+    assert 'shard-1' in caplog.text
+    assert router.route(message_from(3))
+
+
+def test_json_backend_is_not_migrated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(config, 'STORAGE_BACKEND', 'json')
+    (tmp_path / config.USER_DATA_FILE).write_text('{"5": {"name": "A"}}', encoding='utf-8')
+    webhook._prepare_databases()
+    assert (tmp_path / config.USER_DATA_FILE).exists()
+    assert not (tmp_path / config.USER_DATA_DB).exists()
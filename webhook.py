@@ -0,0 +1,167 @@
+"""Приём обновлений через webhook и распределение по нескольким процессам-обработчикам.
+
+Обновление направляется в процесс по id пользователя, поэтому обновления одного
+пользователя всегда обрабатываются одним процессом и по порядку, а состояния его
+диалога не расходятся между процессами. Все процессы работают с общими базами SQLite.
+
+Запуск:
+    python webhook.py --workers 4 --port 8443 --url https://bot.example.com/telegram
+Перед сервером обычно стоит обратный прокси с TLS, который передаёт запросы на --host:--port.
+"""
+import os
+import json
+import signal
+import logging
+import argparse
+import threading
+import multiprocessing
+from queue import Full
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+
+def update_user_id(update):
+    """id пользователя из необработанного обновления Telegram (или чата, если пользователя нет)."""
+    for key, value in update.items():
+        if not isinstance(value, dict):
+            continue
+        sender = value.get('from') or value.get('user')
+        if sender:
+            return sender['id']
+        chat = value.get('chat')
+        if chat:
+            return chat['id']
+    return 0
+
+
+# Создание и миграция общих баз до запуска обработчиков, чтобы процессы не выполняли их одновременно
+def _prepare_databases():
+    import config
+    from storage import SQLiteStorage
+    from broadcast import BroadcastStore
+    from persistence import SQLitePersistence
+    # Хранилище json обработчик открывает сам, переносить его в SQLite нельзя
+    if config.STORAGE_BACKEND == 'sqlite':
+        SQLiteStorage(config.USER_DATA_DB, legacy_json_path=config.USER_DATA_FILE).close()
+    BroadcastStore(config.BROADCAST_DB).close()
+    SQLitePersistence(config.PERSISTENCE_DB).flush()
+
+
+def _run_worker(shard, shard_count, updates):
+    # Остановкой управляет маршрутизатор, Ctrl+C в терминале до обработчиков не доходит
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ['SHARD_INDEX'] = str(shard)
+    os.environ['SHARD_COUNT'] = str(shard_count)
+    import main
+    main.run_shard(updates)
+
+
+# HTTP-сервер для webhook: проверяет секрет, выбирает процесс по id пользователя
+# и кладёт обновление в его очередь. Если очередь переполнена или процесс завершился,
+# отвечает 503, и Telegram повторит доставку позже.
+class WebhookRouter:
+    def __init__(self, workers, host='127.0.0.1', port=8443, path='/', secret_token=None, queue_size=1000):
+        self.path = path
+        self.secret_token = secret_token
+        context = multiprocessing.get_context('spawn')
+        self.queues = [context.Queue(queue_size) for _ in range(workers)]
+        self.processes = [
+            context.Process(target=_run_worker, args=(shard, workers, queue), name=f'shard-{shard}')
+            for shard, queue in enumerate(self.queues)
+        ]
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name='webhook-http', daemon=True)
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self):
+        _prepare_databases()
+        for process in self.processes:
+            process.start()
+        self._thread.start()
+        logger.info("Webhook принимает обновления на %s:%d%s, обработчиков: %d", *self.address, self.path, len(self.processes))
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+
+    def route(self, payload):
+        """Ставит обновление в очередь его процесса. Возвращает False, если очередь переполнена или процесс завершился."""
+        shard = update_user_id(json.loads(payload)) % len(self.queues)
+        process = self.processes[shard]
+        if not process.is_alive():
+            logger.error("Обработчик %s завершился с кодом %s, обновление не принято", process.name, process.exitcode)
+            return False
+        try:
+            self.queues[shard].put(payload, timeout=1)
+        except Full:
+            return False
+        return True
+
+    def _make_handler(self):
+        router = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if self.path != router.path:
+                    status = 404
+                elif router.secret_token and self.headers.get('X-Telegram-Bot-Api-Secret-Token') != router.secret_token:
+                    status = 403
+                else:
+                    try:
+                        status = 200 if router.route(body.decode('utf-8')) else 503
+                    except (ValueError, KeyError, TypeError):
+                        status = 400
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='число процессов-обработчиков')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--path', default='/telegram', help='путь, на который Telegram присылает обновления')
+    parser.add_argument('--url', help='публичный адрес webhook; если указан, он регистрируется в Telegram')
+    parser.add_argument('--max-connections', type=int, default=40, help='параллельных соединений от Telegram')
+    args = parser.parse_args()
+
+    secret_token = os.getenv('WEBHOOK_SECRET')
+    router = WebhookRouter(args.workers, args.host, args.port, args.path, secret_token=secret_token)
+    router.start()
+    if args.url:
+        from telegram import Bot
+        bot = Bot(os.getenv('TELEGRAM_TOKEN'), base_url=os.getenv('TELEGRAM_API_URL'))
+        bot.set_webhook(args.url, max_connections=args.max_connections, secret_token=secret_token)
+
+    stop_event = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop_event.set())
+    stop_event.wait()
+    logger.info("Остановка webhook и обработчиков")
+    router.stop()
+
+
+if __name__ == '__main__':
+    main()